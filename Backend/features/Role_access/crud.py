@@ -2,16 +2,27 @@ from features.authentication.models import User, Role
 from features.Role_access.models import ModeratorRequest, RequestStatus
 from features.Role_access.schemas import ModeratorRequestCreate
 from features.authentication.crud import get_user_by_id
-from sqlalchemy.orm import Session
+from features.authentication.profile_cache import invalidate_user_profile
+from features.authentication.auth_jwt import invalidate_current_user
+from sqlalchemy.orm import Session, joinedload
+from typing import Optional
+from pagination import paginate
 import uuid
 
 
+def moderator_request_read_options():
+    """Loader options for the user and university embedded in ModeratorRequestRead"""
+    return (joinedload(ModeratorRequest.user).joinedload(User.university),)
+
+
 def update_user_role(db: Session, user_id: str, role: Role):
     user = get_user_by_id(db, user_id)
     if user:
         user.role = role
         db.commit()
         db.refresh(user)
+        invalidate_user_profile(user_id)
+        invalidate_current_user(user_id)
     return user
 
 def create_moderator_request(db: Session, user_id: str, request: ModeratorRequestCreate):
@@ -26,13 +37,14 @@ def create_moderator_request(db: Session, user_id: str, request: ModeratorReques
     return db_request
 
 def get_moderator_request(db: Session, request_id: str):
-    return db.query(ModeratorRequest).filter(ModeratorRequest.id == request_id).first()
+    return db.query(ModeratorRequest).options(*moderator_request_read_options()).filter(ModeratorRequest.id == request_id).first()
 
 def get_user_moderator_request(db: Session, user_id: str):
-    return db.query(ModeratorRequest).filter(ModeratorRequest.user_id == user_id).first()
+    return db.query(ModeratorRequest).options(*moderator_request_read_options()).filter(ModeratorRequest.user_id == user_id).first()
 
-def get_all_moderator_requests(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(ModeratorRequest).offset(skip).limit(limit).all()
+def get_all_moderator_requests(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(ModeratorRequest).options(*moderator_request_read_options())
+    return paginate(query, ModeratorRequest, skip, limit, cursor)
 
 def update_moderator_request_status(db: Session, request_id: str, status: RequestStatus):
     request = get_moderator_request(db, request_id)
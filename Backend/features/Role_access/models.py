@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -11,6 +11,10 @@ class RequestStatus(str, enum.Enum):
 
 class ModeratorRequest(Base):
     __tablename__ = 'moderator_requests'
+    __table_args__ = (
+        Index('ix_moderator_requests_created_at_id', 'created_at', 'id'),
+        Index('ix_moderator_requests_user_id', 'user_id'),
+    )
 
     id = Column(String, primary_key=True, index=True)
     user_id = Column(String, ForeignKey('users.id'), nullable=False)
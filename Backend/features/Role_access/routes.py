@@ -1,33 +1,53 @@
 from features.Role_access.models import RequestStatus
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from features.authentication.models import User, Role
-from features.authentication.schemas import UserRead
-from features.authentication.crud import get_all_users, get_user_by_id
+from features.authentication.models import Role
+from features.authentication.schemas import UserFilter, UserRead
+from features.authentication.crud import delete_user, get_all_users, get_user_by_id, stream_users
 from database import get_db
+from pagination import set_next_cursor
 from features.Role_access.crud import update_user_role, create_moderator_request, get_moderator_request, get_user_moderator_request, get_all_moderator_requests, update_moderator_request_status
 from features.Role_access.schemas import ModeratorRequestCreate, ModeratorRequestRead, ModeratorRequestUpdate
-from features.authentication.auth_jwt import get_admin_user, get_current_user
+from features.authentication.auth_jwt import CurrentUser, get_admin_user, get_current_user, invalidate_current_user
+from features.authentication.profile_cache import invalidate_user_profile
 
 
 user_role_router = APIRouter(prefix="/admin", tags=["admin"])
 
 @user_role_router.get("/users", response_model=List[UserRead])
-async def get_users(
+def get_users(
+    response: Response,
+    filters: UserFilter = Depends(),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: CurrentUser = Depends(get_admin_user)
 ):
-    """Get all users (admin only)"""
-    return get_all_users(db)
+    """Get a page of users, filtered by role, university or username prefix (admin only)"""
+    users, next_cursor = get_all_users(db, filters, skip, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return users
+
+@user_role_router.get("/users/export")
+def export_users(
+    filters: UserFilter = Depends(),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_admin_user)
+):
+    """Stream every matching user as newline-delimited JSON (admin only)"""
+    lines = (user.model_dump_json() + "\n" for user in stream_users(db, filters))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
 @user_role_router.put("/users/{user_id}/role")
 async def update_role(
     user_id: str,
     role: Role,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: CurrentUser = Depends(get_admin_user)
 ):
     """Update user role (admin only)"""
     user = get_user_by_id(db, user_id)
@@ -44,13 +64,34 @@ async def update_role(
     updated_user = update_user_role(db, user_id, role)
     return {"message": f"User role updated to {role.value}"}
 
+@user_role_router.delete("/users/{user_id}")
+def remove_user(
+    user_id: str,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_admin_user)
+):
+    """Delete a user without listings, orders, meetups or chats (admin only)"""
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Cannot delete your own account")
+
+    try:
+        deleted = delete_user(db, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    invalidate_user_profile(user_id)
+    invalidate_current_user(user_id)
+    return {"message": "User deleted successfully"}
+
 moderator_request_router = APIRouter(prefix="/moderator-requests", tags=["moderator-requests"])
 
 @moderator_request_router.post("/", response_model=ModeratorRequestRead)
 def request_moderator_role(
     request: ModeratorRequestCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Create a new moderator request"""
     # Check if user already has a pending request
@@ -65,18 +106,24 @@ def request_moderator_role(
 
 @moderator_request_router.get("/", response_model=List[ModeratorRequestRead])
 async def get_all_requests(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: CurrentUser = Depends(get_admin_user)
 ):
     """Get all moderator requests (admin only)"""
-    return get_all_moderator_requests(db)
+    requests, next_cursor = get_all_moderator_requests(db, skip, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return requests
 
 @moderator_request_router.put("/{request_id}", response_model=ModeratorRequestRead)
 async def update_request_status(
     request_id: str,
     status_update: ModeratorRequestUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: CurrentUser = Depends(get_admin_user)
 ):
     """Update moderator request status (admin only)"""
     request = get_moderator_request(db, request_id)
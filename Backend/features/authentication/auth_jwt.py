@@ -1,27 +1,77 @@
+import os
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from . import crud
+from cache import TTLCache
 from database import get_db
 from config import settings
 from features.authentication.models import Role
+from features.authentication.invalidation import cache_invalidator
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# Put the user id, role and university in the token, so requests authenticate without
+# touching the database at all. Role changes then only apply once the token is renewed.
+EMBED_USER_CLAIMS = os.getenv("AUTH_EMBED_CLAIMS") == "1"
+
+
+class CurrentUser(NamedTuple):
+    """The authenticated user as seen by route dependencies, without the full users row"""
+    id: str
+    email: str
+    role: Role
+    university_id: str
+
+
+# CurrentUser keyed by (token subject, token iat), entries are dropped when the user's role
+# changes. Other workers only drop theirs when CHAT_PUBSUB_URL is set, otherwise a worker
+# keeps serving the old role for up to the TTL.
+auth_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+)
+
+
+def _drop_current_user(user_id: Optional[str]):
+    if user_id is None:
+        auth_cache.clear()
+    else:
+        auth_cache.pop_matching(lambda key, principal: principal.id == user_id)
+
+
+cache_invalidator.register("auth", _drop_current_user)
+
+
+def invalidate_current_user(user_id: str):
+    """Make the next request of `user_id` load their role and university again, on every worker"""
+    cache_invalidator.invalidate("auth", user_id)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": now})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def token_claims(user) -> dict:
+    """Claims identifying `user` in an access token"""
+    claims = {"sub": user.email}
+    if EMBED_USER_CLAIMS:
+        claims.update({"uid": user.id, "role": user.role.value, "uni": user.university_id})
+    return claims
+
+async def authenticate_token(token: str, db: Session) -> CurrentUser:
+    """Resolve an access token to its user, raising a 401 if it isn't valid"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -34,15 +84,27 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = crud.get_user_by_email(db, email=email)
-    if user is None:
-        raise credentials_exception
-    return user
 
-async def get_admin_user(current_user = Depends(get_current_user)):
+    if EMBED_USER_CLAIMS and {"uid", "role", "uni"} <= payload.keys():
+        return CurrentUser(payload["uid"], email, Role(payload["role"]), payload["uni"])
+
+    cache_key = (email, payload.get("iat"))
+    principal = auth_cache.get(cache_key)
+    if principal is None:
+        user = await run_in_threadpool(crud.get_user_by_email, db, email)
+        if user is None:
+            raise credentials_exception
+        principal = CurrentUser(user.id, user.email, user.role, user.university_id)
+        auth_cache.set(cache_key, principal)
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> CurrentUser:
+    return await authenticate_token(token, db)
+
+async def get_admin_user(current_user: CurrentUser = Depends(get_current_user)):
     if current_user.role != Role.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
-    return current_user 
\ No newline at end of file
+    return current_user
@@ -1,33 +1,57 @@
-from sqlalchemy.orm import Session
+from typing import Iterator, Optional
+from sqlalchemy import delete, or_
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
 from . import models, schemas
-from passlib.context import CryptContext
 import uuid
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from features.products.crud import get_university
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from features.products.models import Meetup, Order, Product, University
+from features.Role_access.models import ModeratorRequest
+from features.realtimeChat.models import ChatMessage, ChatParticipant
+from pagination import paginate
+from references import delete_unreferenced
+from .hashing import hash_password, verify_and_update_password
 
 def get_user_by_username(db: Session, username: str):
     print(username)
-    return db.query(models.User).filter(models.User.username == username).first()
+    return (
+        db.query(models.User)
+        .options(joinedload(models.User.university))
+        .filter(models.User.username == username)
+        .first()
+    )
 
 def get_user_by_phone_no(db: Session, phone_no: str):
     return db.query(models.User).filter(models.User.phone_no == phone_no).first()
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    return (
+        db.query(models.User)
+        .options(joinedload(models.User.university))
+        .filter(models.User.email == email)
+        .first()
+    )
 
 
 def get_user_by_id(db: Session, user_id: str):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return (
+        db.query(models.User)
+        .options(joinedload(models.User.university))
+        .filter(models.User.id == user_id)
+        .first()
+    )
 
-def create_user(db: Session, user: schemas.UserCreate):
+async def create_user(db: Session, user: schemas.UserCreate):
     # Check if university exists
-    university = get_university(db, user.university_id)
+    university = await run_in_threadpool(get_university, db, user.university_id)
     if not university:
         raise HTTPException(status_code=400, detail="Invalid university ID. Please select a valid university.")
     
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await hash_password(user.password)
+    return await run_in_threadpool(_insert_user, db, user, hashed_password)
+
+def _insert_user(db: Session, user: schemas.UserCreate, hashed_password: str):
     db_user = models.User(
         id=str(uuid.uuid4()),
         phone_no=user.phone_no,
@@ -41,28 +65,87 @@ def create_user(db: Session, user: schemas.UserCreate):
     )
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
-    return db_user
+    # Loaded with the user so serializing UserRead doesn't lazy load it on the event loop
+    return get_user_by_id(db, db_user.id)
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user_by_email(db, email)
+async def authenticate_user(db: Session, email: str, password: str):
+    user = await run_in_threadpool(get_user_by_email, db, email)
     if not user:
         return None
-    if not pwd_context.verify(password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        # The stored hash used an outdated cost, replace it now that we know the password
+        await run_in_threadpool(_update_password_hash, db, user, new_hash)
     return user
 
+def _update_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+    db.refresh(user)
 
 
 
-def get_all_users(db: Session):
-    """Get all users from the database"""
-    return db.query(models.User).all()
-    return user
-
 
+# Users columns serialized by UserRead and UserExportRead, hashed_password is never loaded for listings
+def _user_list_columns():
+    User = models.User
+    return (
+        User.id, User.phone_no, User.email, User.username, User.first_name, User.last_name,
+        User.gender, User.role, User.university_id, User.created_at
+    )
 
+def user_list_options():
+    # A page holds many users of the same few universities, selectinload fetches each one once
+    return (
+        load_only(*_user_list_columns()),
+        selectinload(models.User.university).load_only(
+            University.id, University.name, University.email, University.created_at,
+            University.updated_at, University.latitude, University.longitude
+        ),
+    )
 
-def get_all_users(db: Session):
-    """Get all users from the database"""
-    return db.query(models.User).all()
\ No newline at end of file
+def filter_users(query, filters: schemas.UserFilter):
+    """Apply the admin listing filters to a query over users"""
+    if filters.role is not None:
+        query = query.filter(models.User.role == filters.role)
+    if filters.university_id:
+        query = query.filter(models.User.university_id == filters.university_id)
+    if filters.username_prefix:
+        query = query.filter(models.User.username.startswith(filters.username_prefix, autoescape=True))
+    return query
+
+def get_all_users(db: Session, filters: schemas.UserFilter, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Get a page of users, newest first, and the cursor of the next page"""
+    query = filter_users(db.query(models.User).options(*user_list_options()), filters)
+    return paginate(query, models.User, skip, limit, cursor)
+
+def stream_users(db: Session, filters: schemas.UserFilter, batch_size: int = 1000) -> Iterator[schemas.UserExportRead]:
+    """Yield every matching user, newest first, fetching plain rows `batch_size` at a time"""
+    query = (
+        filter_users(db.query(*_user_list_columns()), filters)
+        .order_by(models.User.created_at.desc(), models.User.id.desc())
+        .yield_per(batch_size)
+    )
+    for row in query:
+        yield schemas.UserExportRead.model_validate(row)
+
+def user_references(user_id: str):
+    return {
+        "products": Product.seller_id == user_id,
+        "orders": or_(Order.buyer_id == user_id, Order.seller_id == user_id),
+        "meetups": or_(Meetup.buyer_id == user_id, Meetup.seller_id == user_id),
+        "chats": ChatParticipant.user_id == user_id,
+        "messages": ChatMessage.sender_id == user_id,
+    }
+
+def delete_user(db: Session, user_id: str) -> bool:
+    """Delete a user and their moderator requests, raising ValueError if anything else still refers to them"""
+    return bool(delete_unreferenced(
+        db,
+        "user",
+        user_references(user_id),
+        delete(ModeratorRequest).where(ModeratorRequest.user_id == user_id),
+        delete(models.User).where(models.User.id == user_id)
+    ))
@@ -0,0 +1,250 @@
+"""Password hashing on a dedicated process pool.
+
+bcrypt is deliberately slow and CPU bound. Running it inline (or on the
+shared AnyIO threadpool) lets a login burst starve every other endpoint, so
+hashes are computed by a small pool of worker processes instead. Requests
+beyond the pool's queue are turned away with a 429 rather than piling up.
+
+The bcrypt cost is set with BCRYPT_ROUNDS. Hashes made with another cost
+are upgraded on the next successful login. Compare login latency per cost
+from the Backend directory with:
+
+    python -m features.authentication.hashing --concurrency 64 --requests 256 --rounds 10 12
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# The one password context of the app, worker processes build the same one from the environment
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes allowed to wait for a worker, on top of the ones being computed
+HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", str(HASH_WORKERS * 8)))
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def hash_cost(hashed_password: str) -> Optional[int]:
+    """The bcrypt cost a hash was made with, e.g. 12 for "$2b$12$..." """
+    parts = hashed_password.split("$")
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Runs hash/verify calls on a process pool with an admission limit"""
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_size: int = HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+        self._rehashed = 0
+        self._pool_restarts = 0
+        # cost -> [verifications, total seconds, max seconds]
+        self._verify_by_cost: Dict[Optional[int], List[float]] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Workers are only started by the first login, not at import time
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        # Forking a process that already runs threads isn't safe
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def _reset_executor(self, broken: ProcessPoolExecutor):
+        # Concurrent callers see the same broken pool, only the first one replaces it
+        with self._executor_lock:
+            if self._executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self._pool_restarts += 1
+
+    async def _submit(self, fn, *args):
+        """Run `fn` on the pool, starting a new pool once if a worker process died"""
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Password hashing is temporarily unavailable, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    async def _run(self, fn, *args):
+        if self._in_flight >= self.workers + self.queue_size:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts in progress, please retry shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await self._submit(fn, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._in_flight -= 1
+            self._completed += 1
+            self._total_seconds += elapsed
+            self._max_seconds = max(self._max_seconds, elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password and, if its hash uses an outdated cost, rehash it in the same worker call.
+
+        Returns (valid, new_hash), new_hash is None unless the stored hash should be replaced.
+        """
+        started = time.perf_counter()
+        valid, new_hash = await self._run(_verify_and_update, password, hashed_password)
+        elapsed = time.perf_counter() - started
+
+        entry = self._verify_by_cost.setdefault(hash_cost(hashed_password), [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+        if new_hash:
+            self._rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "avg_ms": round(self._total_seconds / self._completed * 1000, 1) if self._completed else 0.0,
+            "max_ms": round(self._max_seconds * 1000, 1),
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "rehashed": self._rehashed,
+            # Pools replaced after a worker process died (OOM kill, crash)
+            "pool_restarts": self._pool_restarts,
+            # Login latency by the cost of the stored hash, includes the rehash when one was due
+            "verify_by_cost": {
+                str(cost): {
+                    "count": count,
+                    "avg_ms": round(total / count * 1000, 1),
+                    "max_ms": round(worst * 1000, 1),
+                }
+                for cost, (count, total, worst) in self._verify_by_cost.items()
+            },
+        }
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(password, hashed_password)
+
+
+async def verify_and_update_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await password_hasher.verify_and_update(password, hashed_password)
+
+
+async def _benchmark(concurrency: int, requests: int, workers: int, rounds: int):
+    hasher = PasswordHasher(workers=workers, queue_size=requests)
+    hashed = pwd_context.handler("bcrypt").using(rounds=rounds).hash("benchmark-password")
+    await hasher.verify("benchmark-password", hashed)  # start the workers
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    # Event loop lag shows whether other requests would still be served during the burst
+    lag = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            lag.append(max(0.0, time.perf_counter() - expected))
+
+    async def login():
+        async with semaphore:
+            started = time.perf_counter()
+            await hasher.verify("benchmark-password", hashed)
+            latencies.append(time.perf_counter() - started)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    hasher.shutdown()
+
+    latencies.sort()
+    print(f"cost {rounds}, {requests} logins, concurrency {concurrency}, {workers} workers: "
+          f"{requests / elapsed:.1f} logins/s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.0f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.0f}ms, "
+          f"max event loop lag {max(lag, default=0) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password verification throughput")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[BCRYPT_ROUNDS], help="bcrypt costs to compare")
+    args = parser.parse_args()
+    for rounds in args.rounds:
+        asyncio.run(_benchmark(args.concurrency, args.requests, args.workers, rounds))
+
+
+if __name__ == "__main__":
+    main()
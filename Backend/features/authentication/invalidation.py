@@ -0,0 +1,75 @@
+import asyncio
+import json
+import uuid
+from typing import Callable, Dict, Optional, Set
+
+from features.realtimeChat.pubsub import create_pubsub_backend
+
+INVALIDATION_TOPIC = "invalidate"
+
+
+class CacheInvalidator:
+    """Clears in-process cache entries on every worker.
+
+    Caches register a handler by name, `invalidate(name, key)` runs it here
+    right away and publishes it through the chat pub/sub backend, so the
+    other workers run it too. With CHAT_PUBSUB_URL unset only this process
+    is cleared, which is only correct with a single worker.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self.backend = None
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, Callable[[Optional[str]], None]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def register(self, cache: str, handler: Callable[[Optional[str]], None]):
+        """Run handler(key) whenever `cache` is invalidated, key None meaning every entry"""
+        self._handlers[cache] = handler
+
+    async def start(self):
+        """Start receiving invalidations from the other workers, called on app startup"""
+        if self._loop is None:
+            self.backend = self._backend or create_pubsub_backend("cache-invalidation:")
+            await self.backend.start(self.deliver)
+            await self.backend.subscribe(INVALIDATION_TOPIC)
+            self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        if self._loop is not None:
+            self._loop = None
+            await self.backend.stop()
+
+    def invalidate(self, cache: str, key: Optional[str] = None):
+        """Drop `key` (or everything) from `cache` here and on the other workers, safe to call from any thread"""
+        self._handlers[cache](key)
+        loop = self._loop
+        if loop is not None:
+            frame = json.dumps({"origin": self.origin, "cache": cache, "key": key})
+            loop.call_soon_threadsafe(self._spawn_publish, frame)
+
+    def _spawn_publish(self, frame: str):
+        # The loop only keeps a weak reference to tasks
+        task = asyncio.create_task(self._publish(frame))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, frame: str):
+        try:
+            await self.backend.publish(INVALIDATION_TOPIC, frame)
+        except Exception as e:
+            print(f"Error publishing cache invalidation: {e}")
+
+    def deliver(self, topic: str, frame: str):
+        message = json.loads(frame)
+        # Already applied when it was published
+        if message["origin"] == self.origin:
+            return
+        handler = self._handlers.get(message["cache"])
+        if handler is not None:
+            handler(message["key"])
+
+
+cache_invalidator = CacheInvalidator()
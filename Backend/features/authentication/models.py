@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, DateTime, Float, Enum, ForeignKey
+from sqlalchemy import Column, String, Boolean, DateTime, Float, Enum, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -13,6 +13,14 @@ class Role(str, enum.Enum):
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Admin listing pages are keyset seeks on (created_at, id), optionally behind a filter
+        Index('ix_users_created_at_id', 'created_at', 'id'),
+        Index('ix_users_role_created_at_id', 'role', 'created_at', 'id'),
+        Index('ix_users_university_id_created_at_id', 'university_id', 'created_at', 'id'),
+        # Lets username LIKE 'prefix%' use an index whatever the database collation
+        Index('ix_users_username_pattern', 'username', postgresql_ops={'username': 'text_pattern_ops'}),
+    )
 
     id = Column(String, primary_key=True, index=True)
     phone_no = Column(String, nullable=True)
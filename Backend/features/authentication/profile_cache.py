@@ -0,0 +1,63 @@
+from typing import Dict, Iterable, Optional
+from sqlalchemy.orm import joinedload
+
+from cache import TTLCache
+from database import get_db
+from features.authentication.invalidation import cache_invalidator
+from features.authentication.models import User
+from features.authentication.schemas import UserRead
+
+# Serialized UserRead dicts keyed by user id. Values are shared between
+# callers, so treat them as read-only. Invalidations reach the other workers
+# only when CHAT_PUBSUB_URL is set, otherwise they serve stale profiles for up
+# to the TTL.
+profile_cache = TTLCache(maxsize=2048, ttl=300)
+
+
+def get_user_profiles(user_ids: Iterable[str]) -> Dict[str, dict]:
+    """Get UserRead dicts for the given ids, loading all cache misses with a single query"""
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        profile = profile_cache.get(user_id)
+        if profile is None:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+
+    if missing:
+        db = next(get_db())
+        try:
+            users = (
+                db.query(User)
+                .options(joinedload(User.university))
+                .filter(User.id.in_(missing))
+                .all()
+            )
+            for user in users:
+                profile = UserRead.model_validate(user).model_dump(mode='json')
+                profile_cache.set(user.id, profile)
+                profiles[user.id] = profile
+        finally:
+            db.close()
+    return profiles
+
+
+def _drop_user_profile(user_id: Optional[str]):
+    if user_id is None:
+        profile_cache.clear()
+    else:
+        profile_cache.pop(user_id)
+
+
+cache_invalidator.register("profile", _drop_user_profile)
+
+
+def invalidate_user_profile(user_id: str):
+    """Drop a user's cached profile on every worker after their role or profile data changed"""
+    cache_invalidator.invalidate("profile", user_id)
+
+
+def invalidate_all_user_profiles():
+    """Drop every cached profile on every worker, e.g. after a university embedded in them changed"""
+    cache_invalidator.invalidate("profile")
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+# Approximated sliding window: each key keeps the count of the current and the
+# previous fixed window, the previous one is weighted by how much of it still
+# overlaps the sliding window. Two counters per key, no per-request timestamps.
+
+
+def _estimate(previous: int, current: int, window: float, now: float) -> float:
+    elapsed = now % window
+    return previous * (1 - elapsed / window) + current
+
+
+class InMemoryRateLimitBackend:
+    """Counters kept in this process, only correct with a single worker.
+
+    Holds at most `max_keys` keys, the least recently hit ones are evicted first.
+    """
+
+    name = "in-process"
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> (window index, previous window count, current window count)
+        self._counters: "OrderedDict[str, Tuple[int, int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def hit(self, key: str, window: float, now: float) -> float:
+        index = int(now // window)
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[0] < index - 1:
+                previous, current = 0, 0
+            elif entry[0] == index - 1:
+                previous, current = entry[2], 0
+            else:
+                previous, current = entry[1], entry[2]
+            current += 1
+            self._counters[key] = (index, previous, current)
+            self._counters.move_to_end(key)
+            while len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        return _estimate(previous, current, window, now)
+
+
+class RedisRateLimitBackend:
+    """Counters shared by every worker and host through Redis. Needs the `redis` package.
+
+    Each key uses two short-lived counters (current and previous window) that
+    expire on their own, so Redis evicts idle keys without a cleanup job.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, key_prefix: str = "rate-limit:"):
+        self.url = url
+        self.key_prefix = key_prefix
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("RATE_LIMIT_URL is set but the redis package is not installed (pip install redis)")
+            self._redis = redis.from_url(self.url)
+        return self._redis
+
+    async def hit(self, key: str, window: float, now: float) -> float:
+        index = int(now // window)
+        current_key = f"{self.key_prefix}{key}:{index}"
+        previous_key = f"{self.key_prefix}{key}:{index - 1}"
+        async with self._client().pipeline(transaction=False) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, int(window * 2) + 1)
+            pipe.get(previous_key)
+            current, _, previous = await pipe.execute()
+        return _estimate(int(previous or 0), int(current), window, now)
+
+
+def create_rate_limit_backend():
+    """Pick the counter backend, set RATE_LIMIT_URL (redis://...) when running several workers"""
+    url = os.getenv("RATE_LIMIT_URL")
+    if url:
+        return RedisRateLimitBackend(url)
+    return InMemoryRateLimitBackend(int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+
+
+class SlidingWindowLimiter:
+    """Allows `limit` hits per key within any `window` seconds"""
+
+    def __init__(self, backend, limit: int, window: float):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+
+    async def check(self, key: str):
+        """Count a hit for `key`, raising a 429 when it is over the limit"""
+        if await self.backend.hit(key, self.window, time.time()) > self.limit:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please try again later",
+                headers={"Retry-After": str(int(self.window))}
+            )
+
+
+class LoginRateLimiter:
+    """Throttles credential checks per client IP and per account"""
+
+    def __init__(self, backend=None, per_ip: int = 30, per_email: int = 10, window: float = 60.0):
+        self._backend = backend
+        self.per_ip = per_ip
+        self.per_email = per_email
+        self.window = window
+        self._ip_limiter: Optional[SlidingWindowLimiter] = None
+        self._email_limiter: Optional[SlidingWindowLimiter] = None
+
+    def _limiters(self) -> Tuple[SlidingWindowLimiter, SlidingWindowLimiter]:
+        if self._ip_limiter is None:
+            backend = self._backend or create_rate_limit_backend()
+            self._ip_limiter = SlidingWindowLimiter(backend, self.per_ip, self.window)
+            self._email_limiter = SlidingWindowLimiter(backend, self.per_email, self.window)
+        return self._ip_limiter, self._email_limiter
+
+    async def check(self, request: Request, email: Optional[str]):
+        """Reject the attempt before any database or hashing work if either limit is exceeded"""
+        ip_limiter, email_limiter = self._limiters()
+        client = request.client.host if request.client else "unknown"
+        await ip_limiter.check(f"login:ip:{client}")
+        if email:
+            await email_limiter.check(f"login:email:{email.strip().lower()}")
+
+
+login_rate_limiter = LoginRateLimiter(
+    per_ip=int(os.getenv("LOGIN_RATE_LIMIT_PER_IP", "30")),
+    per_email=int(os.getenv("LOGIN_RATE_LIMIT_PER_EMAIL", "10")),
+    window=float(os.getenv("LOGIN_RATE_LIMIT_WINDOW_SECONDS", "60"))
+)
@@ -1,43 +1,46 @@
 from datetime import timedelta
 import config
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from typing import List
 
-from features.authentication.models import User, Role
 from . import schemas, crud
 from database import get_db
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from features.authentication.auth_jwt import create_access_token, get_current_user, get_admin_user
+from features.authentication.auth_jwt import CurrentUser, create_access_token, get_current_user, get_admin_user, token_claims
 from features.authentication.schemas import Token
+from features.authentication.hashing import password_hasher
+from features.authentication.rate_limit import login_rate_limiter
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 @router.post("/register", response_model=schemas.UserRead)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     # Check if phone number already exists
     # Check if email already exists
     if user.email:
-        db_user = crud.get_user_by_email(db, user.email)
+        db_user = await run_in_threadpool(crud.get_user_by_email, db, user.email)
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
     
-    return crud.create_user(db, user)
+    return await crud.create_user(db, user)
 
 @router.post("/login", response_model=schemas.UserRead)
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    db_user = crud.authenticate_user(db, user.email, user.password)
+async def login(user: schemas.UserLogin, request: Request, db: Session = Depends(get_db)):
+    await login_rate_limiter.check(request, user.email)
+    db_user = await crud.authenticate_user(db, user.email, user.password)
     if not db_user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     return db_user
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     print("Received login request:")
     print("Username:", form_data.username)
-    print("Password:", form_data.password)
+    await login_rate_limiter.check(request, form_data.username)
 
-    user = crud.authenticate_user(db, form_data.username, form_data.password)
+    user = await crud.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     access_token_expires = timedelta(minutes=config.settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -45,14 +48,18 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     # Use email as the subject identifier for the token
     # This is more reliable than phone_no which might be null
     access_token = create_access_token(
-        data={"sub": form_data.username}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.get("/me", response_model=schemas.UserRead)
-def read_users_me(current_user: User = Depends(get_current_user)):
-    return current_user
+def read_users_me(current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Authentication only caches the id, role and university, the profile is loaded here
+    user = crud.get_user_by_id(db, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 @router.get("/user/{user_id}", response_model=schemas.UserRead)
 def get_user_by_id(user_id: str, db: Session = Depends(get_db)):
@@ -72,3 +79,9 @@ def get_user_by_username(username: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+
+
+@router.get("/hashing/metrics")
+async def get_hashing_metrics(current_user: CurrentUser = Depends(get_admin_user)):
+    """Password hashing pool queue depth, latency and rejection counters (admin only)"""
+    return password_hasher.stats()
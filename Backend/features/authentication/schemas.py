@@ -25,6 +25,20 @@ class UserRead(UserBase):
     class Config:
         from_attributes = True
 
+class UserFilter(BaseModel):
+    role: Optional[Role] = None
+    university_id: Optional[str] = None
+    username_prefix: Optional[str] = None
+
+class UserExportRead(UserBase):
+    id: str
+    role: Role
+    created_at: Optional[datetime] = None
+    university_id: str
+
+    class Config:
+        from_attributes = True
+
 class UserLogin(BaseModel):
     email: str
     password: str
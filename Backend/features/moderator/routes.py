@@ -1,15 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from features.authentication.models import User
-from features.authentication.auth_jwt import get_current_user
+from features.authentication.auth_jwt import CurrentUser, get_current_user
 from database import get_db
+from pagination import set_next_cursor
 from features.products import crud, schemas
 
 router = APIRouter(prefix="/moderator", tags=["moderator"])
 
-def check_moderator_role(current_user: User):
+def check_moderator_role(current_user: CurrentUser):
     """Check if the current user has moderator role"""
     if current_user.role != "moderator":
         raise HTTPException(
@@ -19,24 +19,27 @@ def check_moderator_role(current_user: User):
 
 @router.get("/products/pending", response_model=List[schemas.ProductRead])
 def get_pending_products(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Get all pending products for the moderator's university"""
     # Check if user is a moderator
     check_moderator_role(current_user)
     
     # Get pending products for the moderator's university
-    products = crud.get_pending_products(db, current_user.university_id, skip, limit)
+    products, next_cursor = crud.get_pending_products(db, current_user.university_id, skip, limit, cursor)
+    set_next_cursor(response, next_cursor)
     return products
 
 @router.put("/products/{product_id}/accept", response_model=schemas.ProductRead)
 def accept_product(
     product_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Accept a product (moderator only)"""
     # Check if user is a moderator
@@ -1,30 +1,98 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, func, insert, or_, tuple_, update
+from sqlalchemy.orm import Session, joinedload
 from . import models, schemas
 import uuid
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 from features.authentication.models import User
+from pagination import paginate
+from references import delete_unreferenced
+from geo import covering_prefixes, geohash_encode, haversine_km
+
+if TYPE_CHECKING:
+    # auth_jwt imports this module through the authentication crud
+    from features.authentication.auth_jwt import CurrentUser
+
+# Loader options for the relationships embedded in ProductRead and OrderRead,
+# so listing N rows doesn't lazy load N universities/products one by one.
+# Built per call because mappers aren't configured yet at import time.
+def product_read_options():
+    return (joinedload(models.Product.university),)
+
+def order_read_options():
+    return (joinedload(models.Order.product).joinedload(models.Product.university),)
 
 # University CRUD operations
 def create_university(db: Session, university: schemas.UniversityCreate):
     db_university = models.University(
         id=str(uuid.uuid4()),
         name=university.name,
-        email=university.email
+        email=university.email,
+        latitude=university.latitude,
+        longitude=university.longitude,
+        geohash=geohash_encode(university.latitude, university.longitude)
     )
     db.add(db_university)
     db.commit()
     db.refresh(db_university)
     return db_university
 
+def update_university(db: Session, db_university: models.University, university: schemas.UniversityCreate):
+    db_university.name = university.name
+    db_university.email = university.email
+    db_university.latitude = university.latitude
+    db_university.longitude = university.longitude
+    db_university.geohash = geohash_encode(university.latitude, university.longitude)
+    db.commit()
+    db.refresh(db_university)
+    return db_university
+
 def get_university(db: Session, university_id: str):
     return db.query(models.University).filter(models.University.id == university_id).first()
 
+def university_references(university_id: str):
+    return {
+        "products": models.Product.university_id == university_id,
+        "users": User.university_id == university_id,
+    }
+
+def delete_university(db: Session, university_id: str) -> bool:
+    """Delete a university, raising ValueError if products or users still belong to it"""
+    return bool(delete_unreferenced(
+        db,
+        "university",
+        university_references(university_id),
+        delete(models.University).where(models.University.id == university_id)
+    ))
+
 def get_university_by_email(db: Session, email: str):
     return db.query(models.University).filter(models.University.email == email).first()
 
 def get_all_universities(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.University).offset(skip).limit(limit).all()
 
+def get_nearby_universities(db: Session, latitude: float, longitude: float, radius_km: float):
+    """Get (university, distance_km) pairs within `radius_km` of a point, nearest first.
+
+    The geohash index narrows the rows down to the cells around the point,
+    only those candidates get an exact haversine check.
+    """
+    query = db.query(models.University)
+    prefixes = covering_prefixes(latitude, longitude, radius_km)
+    if prefixes:
+        # '~' sorts after every geohash character, so this is a prefix range on the index
+        query = query.filter(or_(*(
+            (models.University.geohash >= prefix) & (models.University.geohash < prefix + '~')
+            for prefix in prefixes
+        )))
+
+    nearby = []
+    for university in query.all():
+        distance = haversine_km(latitude, longitude, university.latitude, university.longitude)
+        if distance <= radius_km:
+            nearby.append((university, distance))
+    nearby.sort(key=lambda pair: pair[1])
+    return nearby
+
 # Product CRUD operations
 def create_product(db: Session, product: schemas.ProductCreate, seller_id: str):
     # Verify university exists
@@ -43,22 +111,31 @@ def create_product(db: Session, product: schemas.ProductCreate, seller_id: str):
     return db_product
 
 def get_product(db: Session, product_id: str):
-    return db.query(models.Product).filter(models.Product.id == product_id).first()
+    return db.query(models.Product).options(*product_read_options()).filter(models.Product.id == product_id).first()
 
 def get_products(
     db: Session, 
     skip: int = 0, 
     limit: int = 100,
     university_id: Optional[str] = None,
-    current_user: Optional[User] = None
+    current_user: Optional["CurrentUser"] = None,
+    cursor: Optional[str] = None,
+    filters: Optional[schemas.ProductFilter] = None
 ):
-    query = db.query(models.Product)
+    """Get a page of visible products, newest first, and the cursor of the next page"""
+    query = db.query(models.Product).options(*product_read_options())
     
     # Filter by university if specified
     if university_id:
         query = query.filter(models.Product.university_id == university_id)
     
-    # Handle visibility
+    query = filter_visible_products(query, current_user)
+    if filters:
+        query = filter_products(query, filters)
+    return paginate(query, models.Product, skip, limit, cursor)
+
+def filter_visible_products(query, current_user: Optional["CurrentUser"] = None):
+    """Restrict a product query to the products `current_user` is allowed to see"""
     if current_user:
         # If user is logged in, show all products from their university
         # plus products marked as visible to all
@@ -69,8 +146,127 @@ def get_products(
     else:
         # If user is not logged in, only show products visible to all
         query = query.filter(models.Product.visibility == models.ProductVisibility.ALL)
-    
-    return query.offset(skip).limit(limit).all()
+    return query
+
+def filter_products(query, filters: schemas.ProductFilter):
+    """Apply the catalog filters that are set in `filters` to a product query"""
+    if filters.category:
+        query = query.filter(models.Product.category == filters.category)
+    if filters.condition:
+        query = query.filter(models.Product.condition == filters.condition)
+    if filters.min_price is not None:
+        query = query.filter(models.Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        query = query.filter(models.Product.price <= filters.max_price)
+    if filters.in_stock:
+        query = query.filter(models.Product.stock > 0)
+    if filters.min_rating is not None:
+        query = query.filter(models.Product.avg_rating >= filters.min_rating)
+    return query
+
+def get_product_facets(
+    db: Session,
+    university_id: Optional[str] = None,
+    current_user: Optional["CurrentUser"] = None,
+    filters: Optional[schemas.ProductFilter] = None
+):
+    """Count the visible products per category and per condition in a single GROUPING SETS query"""
+    query = db.query(
+        models.Product.category,
+        models.Product.condition,
+        func.count(models.Product.id).label('count')
+    )
+    if university_id:
+        query = query.filter(models.Product.university_id == university_id)
+    query = filter_visible_products(query, current_user)
+    if filters:
+        query = filter_products(query, filters)
+    query = query.group_by(func.grouping_sets(
+        tuple_(models.Product.category),
+        tuple_(models.Product.condition),
+        tuple_()
+    ))
+
+    # category and condition are NOT NULL, so the NULL side tells which set a row belongs to
+    facets = {'total': 0, 'category': {}, 'condition': {}}
+    for category, condition, count in query.all():
+        if category is not None:
+            facets['category'][category] = count
+        elif condition is not None:
+            facets['condition'][condition] = count
+        else:
+            facets['total'] = count
+    return facets
+
+def get_nearby_products(
+    db: Session,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: Optional["CurrentUser"] = None,
+    filters: Optional[schemas.ProductFilter] = None
+):
+    """Get (product, distance_km) pairs for products of universities within `radius_km`, nearest first"""
+    distances = {
+        university.id: distance
+        for university, distance in get_nearby_universities(db, latitude, longitude, radius_km)
+    }
+    if not distances:
+        return []
+
+    # Products are located at their university, so sort by the university's distance rank
+    nearest_first = sorted(distances, key=distances.get)
+    rank = case({university_id: position for position, university_id in enumerate(nearest_first)},
+                value=models.Product.university_id)
+    query = (
+        db.query(models.Product)
+        .options(*product_read_options())
+        .filter(models.Product.university_id.in_(nearest_first))
+    )
+    query = filter_visible_products(query, current_user)
+    if filters:
+        query = filter_products(query, filters)
+    products = (
+        query.order_by(rank, models.Product.created_at.desc(), models.Product.id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    return [(product, distances[product.university_id]) for product in products]
+
+def search_products(
+    db: Session,
+    search: str,
+    skip: int = 0,
+    limit: int = 20,
+    university_id: Optional[str] = None,
+    current_user: Optional["CurrentUser"] = None,
+    filters: Optional[schemas.ProductFilter] = None
+):
+    """Full-text search over accepted, visible products, best matches first"""
+    ts_query = func.websearch_to_tsquery('english', search)
+    rank = func.ts_rank(models.Product.search_vector, ts_query)
+    query = (
+        db.query(models.Product)
+        .options(*product_read_options())
+        .filter(
+            models.Product.search_vector.op('@@')(ts_query),
+            models.Product.status == models.ProductStatus.ACCEPTED
+        )
+    )
+    if university_id:
+        query = query.filter(models.Product.university_id == university_id)
+    query = filter_visible_products(query, current_user)
+    if filters:
+        query = filter_products(query, filters)
+    return (
+        query.order_by(rank.desc(), models.Product.created_at.desc(), models.Product.id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
 
 def update_product(db: Session, product_id: str, product: schemas.ProductUpdate):
     db_product = get_product(db, product_id)
@@ -89,25 +285,65 @@ def update_product(db: Session, product_id: str, product: schemas.ProductUpdate)
         db.refresh(db_product)
     return db_product
 
-def delete_product(db: Session, product_id: str):
-    db_product = get_product(db, product_id)
-    if db_product:
-        db.delete(db_product)
-        db.commit()
-    return db_product
+def product_references(product_id: str):
+    return {
+        "orders": models.Order.product_id == product_id,
+        "meetups": models.Meetup.product_id == product_id,
+    }
 
-def get_seller_products(db: Session, seller_id: str):
-    return db.query(models.Product).filter(models.Product.seller_id == seller_id).all() 
+def delete_product(db: Session, product_id: str) -> bool:
+    """Delete a product, raising ValueError if orders or meetups still refer to it"""
+    return bool(delete_unreferenced(
+        db,
+        "product",
+        product_references(product_id),
+        delete(models.Product).where(models.Product.id == product_id)
+    ))
+
+def get_seller_products(
+    db: Session,
+    seller_id: str,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user: Optional["CurrentUser"] = None
+):
+    """Get a page of a seller's products that `current_user` is allowed to see"""
+    query = db.query(models.Product).options(*product_read_options()).filter(models.Product.seller_id == seller_id)
+    query = filter_visible_products(query, current_user)
+    return paginate(query, models.Product, limit=limit, cursor=cursor)
 
 # Order CRUD operations
-def create_order(db: Session, order: schemas.OrderCreate, buyer_id: str):
-    # Verify product exists and has enough stock
-    product = get_product(db, order.product_id)
-    if not product:
+def adjust_stock(db: Session, product_id: str, delta: int) -> Optional[int]:
+    """Add `delta` to a product's stock in one conditional UPDATE, never letting it go below zero.
+
+    Returns the new stock, or None if the product doesn't exist or doesn't
+    have enough stock. The check and the write happen in the same statement,
+    so concurrent orders can't oversell and no row lock is held in between.
+    """
+    result = db.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id, models.Product.stock + delta >= 0)
+        .values(stock=models.Product.stock + delta)
+        .returning(models.Product.stock)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar_one_or_none()
+
+def _raise_stock_error(db: Session, product_id: str, requested: int):
+    """Roll back a failed stock change and explain why it failed"""
+    db.rollback()
+    available = db.query(models.Product.stock).filter(models.Product.id == product_id).scalar()
+    if available is None:
         raise ValueError("Product not found")
-    
-    if product.stock < order.quantity:
-        raise ValueError(f"Not enough stock available. Available: {product.stock}, Requested: {order.quantity}")
+    raise ValueError(f"Not enough stock available. Available: {available}, Requested: {requested}")
+
+def create_order(db: Session, order: schemas.OrderCreate, buyer_id: str):
+    if order.quantity <= 0:
+        raise ValueError("Quantity must be positive")
+
+    # Reserve the stock first, the order is only written if that succeeded
+    if adjust_stock(db, order.product_id, -order.quantity) is None:
+        _raise_stock_error(db, order.product_id, order.quantity)
     
     # Create the order
     db_order = models.Order(
@@ -116,63 +352,98 @@ def create_order(db: Session, order: schemas.OrderCreate, buyer_id: str):
         **order.model_dump()
     )
     
-    # Update product stock
-    product.stock -= order.quantity
-    
     db.add(db_order)
     db.commit()
     db.refresh(db_order)
     return db_order
 
+def create_orders(db: Session, orders: List[schemas.OrderCreate], buyer_id: str):
+    """Create the orders of a cart in one transaction, either all of them or none"""
+    quantities = {}
+    for order in orders:
+        if order.quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        quantities[order.product_id] = quantities.get(order.product_id, 0) + order.quantity
+
+    # Reserve in product id order, so two carts sharing products lock the rows in the same order
+    for product_id in sorted(quantities):
+        if adjust_stock(db, product_id, -quantities[product_id]) is None:
+            _raise_stock_error(db, product_id, quantities[product_id])
+
+    rows = [
+        {'id': str(uuid.uuid4()), 'buyer_id': buyer_id, **order.model_dump()}
+        for order in orders
+    ]
+    db.execute(insert(models.Order), rows)
+    db.commit()
+
+    order_ids = [row['id'] for row in rows]
+    created = {
+        db_order.id: db_order
+        for db_order in db.query(models.Order).options(*order_read_options()).filter(models.Order.id.in_(order_ids))
+    }
+    return [created[order_id] for order_id in order_ids]
+
 def get_order(db: Session, order_id: str):
-    return db.query(models.Order).filter(models.Order.id == order_id).first()
+    return db.query(models.Order).options(*order_read_options()).filter(models.Order.id == order_id).first()
 
-def get_orders(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Order).offset(skip).limit(limit).all()
+def get_orders(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Order).options(*order_read_options())
+    return paginate(query, models.Order, skip, limit, cursor)
 
-def get_buyer_orders(db: Session, buyer_id: str):
-    return db.query(models.Order).filter(models.Order.buyer_id == buyer_id).all()
+def get_buyer_orders(db: Session, buyer_id: str, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Order).options(*order_read_options()).filter(models.Order.buyer_id == buyer_id)
+    return paginate(query, models.Order, limit=limit, cursor=cursor)
 
-def get_seller_orders(db: Session, seller_id: str):
-    return db.query(models.Order).filter(models.Order.seller_id == seller_id).all()
+def get_seller_orders(db: Session, seller_id: str, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Order).options(*order_read_options()).filter(models.Order.seller_id == seller_id)
+    return paginate(query, models.Order, limit=limit, cursor=cursor)
 
 def update_order(db: Session, order_id: str, order: schemas.OrderUpdate):
-    db_order = get_order(db, order_id)
+    # Lock the order so two concurrent updates can't both apply their quantity difference
+    db_order = (
+        db.query(models.Order)
+        .filter(models.Order.id == order_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
     if db_order:
         # Get the current quantity
         current_quantity = db_order.quantity
         
-        # Update the order with new data
         update_data = order.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_order, key, value)
-        
+        if 'quantity' in update_data and update_data['quantity'] <= 0:
+            db.rollback()
+            raise ValueError("Quantity must be positive")
+
         # If quantity changed, update product stock accordingly
         if 'quantity' in update_data and update_data['quantity'] != current_quantity:
-            product = get_product(db, db_order.product_id)
             quantity_diff = current_quantity - update_data['quantity']
-            
-            # If increasing order quantity, check if enough stock
-            if quantity_diff < 0 and abs(quantity_diff) > product.stock:
-                raise ValueError(f"Not enough stock available. Available: {product.stock}, Additional needed: {abs(quantity_diff)}")
-            
-            # Update product stock
-            product.stock += quantity_diff
+            if adjust_stock(db, db_order.product_id, quantity_diff) is None:
+                _raise_stock_error(db, db_order.product_id, -quantity_diff)
+        
+        # Update the order with new data
+        for key, value in update_data.items():
+            setattr(db_order, key, value)
         
         db.commit()
         db.refresh(db_order)
     return db_order
 
 def delete_order(db: Session, order_id: str):
-    db_order = get_order(db, order_id)
+    # Only the request that actually deletes the row restores the stock
+    db_order = db.scalars(
+        delete(models.Order)
+        .where(models.Order.id == order_id)
+        .returning(models.Order)
+        .execution_options(synchronize_session=False)
+    ).first()
     if db_order:
-        # Restore product stock
-        product = get_product(db, db_order.product_id)
-        if product:
-            product.stock += db_order.quantity
-        
-        db.delete(db_order)
-        db.commit()
+        adjust_stock(db, db_order.product_id, db_order.quantity)
+        # Keep the returned order readable after the row is gone
+        db.expunge(db_order)
+    db.commit()
     return db_order
 
 # Product status operations
@@ -187,11 +458,12 @@ def accept_product(db: Session, product_id: str):
         db.refresh(db_product)
     return db_product
 
-def get_pending_products(db: Session, university_id: str, skip: int = 0, limit: int = 100):
+def get_pending_products(db: Session, university_id: str, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
     """
-    Get all pending products for a specific university
+    Get a page of pending products for a specific university
     """
-    return db.query(models.Product).filter(
+    query = db.query(models.Product).options(*product_read_options()).filter(
         models.Product.university_id == university_id,
         models.Product.status == models.ProductStatus.PENDING
-    ).offset(skip).limit(limit).all()
\ No newline at end of file
+    )
+    return paginate(query, models.Product, skip, limit, cursor)
\ No newline at end of file
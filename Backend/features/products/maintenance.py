@@ -0,0 +1,142 @@
+"""Maintenance tasks for the product catalog tables.
+
+Run from the Backend directory, e.g.:
+
+    python -m features.products.maintenance backfill-geohash
+    python -m features.products.maintenance purge-idempotency-keys
+    python -m features.products.maintenance delete-unused-universities
+    python -m features.products.maintenance purge-rejected-meetups --older-than-days 30
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, exists, func, select
+from database import get_db
+from features.authentication.models import User
+# Registers the models the User relationships refer to
+import features.Role_access.models  # noqa: F401
+from geo import geohash_encode
+from idempotency import purge_expired_keys
+from . import models
+
+BATCH_SIZE = 500
+
+
+def backfill_university_geohashes(batch_size: int = BATCH_SIZE) -> int:
+    """Fill in the geohash of universities created before the column existed.
+
+    Returns the number of universities updated.
+    """
+    db = next(get_db())
+    updated = 0
+    try:
+        while True:
+            universities = (
+                db.query(models.University)
+                .filter(models.University.geohash.is_(None))
+                .limit(batch_size)
+                .all()
+            )
+            if not universities:
+                break
+            for university in universities:
+                university.geohash = geohash_encode(university.latitude, university.longitude)
+            db.commit()
+            updated += len(universities)
+    finally:
+        db.close()
+    return updated
+
+
+def _delete_in_batches(db, model, condition, batch_size: int) -> int:
+    """Delete the rows of `model` matching `condition`, `batch_size` at a time so locks stay short"""
+    deleted = 0
+    while True:
+        batch = select(model.id).where(condition).limit(batch_size).scalar_subquery()
+        result = db.execute(delete(model).where(model.id.in_(batch)))
+        db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+def delete_unused_universities(batch_size: int = BATCH_SIZE) -> int:
+    """Delete universities no product or user belongs to, returns the number deleted"""
+    db = next(get_db())
+    try:
+        return _delete_in_batches(
+            db,
+            models.University,
+            ~exists().where(models.Product.university_id == models.University.id)
+            & ~exists().where(User.university_id == models.University.id),
+            batch_size
+        )
+    finally:
+        db.close()
+
+
+def purge_rejected_meetups(older_than_days: int, batch_size: int = BATCH_SIZE) -> int:
+    """Delete meetups rejected more than `older_than_days` days ago, returns the number deleted"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    db = next(get_db())
+    try:
+        return _delete_in_batches(
+            db,
+            models.Meetup,
+            (models.Meetup.status == models.MeetupStatus.REJECTED)
+            & (func.coalesce(models.Meetup.updated_at, models.Meetup.created_at) < cutoff),
+            batch_size
+        )
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product catalog maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    geohash_parser = subparsers.add_parser(
+        "backfill-geohash",
+        help="Compute the geohash of universities that don't have one yet"
+    )
+    geohash_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    purge_parser = subparsers.add_parser(
+        "purge-idempotency-keys",
+        help="Delete expired Idempotency-Key records"
+    )
+    purge_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    universities_parser = subparsers.add_parser(
+        "delete-unused-universities",
+        help="Delete universities without products or users"
+    )
+    universities_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    meetups_parser = subparsers.add_parser(
+        "purge-rejected-meetups",
+        help="Delete meetups that were rejected a while ago"
+    )
+    meetups_parser.add_argument("--older-than-days", type=int, default=30)
+    meetups_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    args = parser.parse_args()
+    if args.command == "backfill-geohash":
+        updated = backfill_university_geohashes(args.batch_size)
+        print(f"Backfilled the geohash of {updated} universities")
+    elif args.command == "purge-idempotency-keys":
+        db = next(get_db())
+        try:
+            deleted = purge_expired_keys(db, args.batch_size)
+        finally:
+            db.close()
+        print(f"Deleted {deleted} expired idempotency keys")
+    elif args.command == "delete-unused-universities":
+        deleted = delete_unused_universities(args.batch_size)
+        print(f"Deleted {deleted} unused universities")
+    elif args.command == "purge-rejected-meetups":
+        deleted = purge_rejected_meetups(args.older_than_days, args.batch_size)
+        print(f"Deleted {deleted} rejected meetups")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from . import models, schemas
 import uuid
 from typing import List, Optional
 from features.authentication.models import User
 from features.products.crud import get_product
+from pagination import paginate
 
 # Meetup CRUD operations
 def create_meetup(db: Session, meetup: schemas.MeetupCreate, buyer_id: str):
@@ -34,17 +36,24 @@ def create_meetup(db: Session, meetup: schemas.MeetupCreate, buyer_id: str):
 def get_meetup(db: Session, meetup_id: str):
     return db.query(models.Meetup).filter(models.Meetup.id == meetup_id).first()
 
-def get_meetups(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Meetup).offset(skip).limit(limit).all()
+def get_meetups(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    return paginate(db.query(models.Meetup), models.Meetup, skip, limit, cursor)
 
-def get_buyer_meetups(db: Session, buyer_id: str):
-    return db.query(models.Meetup).filter(models.Meetup.buyer_id == buyer_id).all()
+def get_buyer_meetups(db: Session, buyer_id: str, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Meetup).filter(models.Meetup.buyer_id == buyer_id)
+    return paginate(query, models.Meetup, limit=limit, cursor=cursor)
 
-def get_seller_meetups(db: Session, seller_id: str):
-    return db.query(models.Meetup).filter(models.Meetup.seller_id == seller_id).all()
+def get_seller_meetups(db: Session, seller_id: str, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Meetup).filter(models.Meetup.seller_id == seller_id)
+    return paginate(query, models.Meetup, limit=limit, cursor=cursor)
 
-def get_product_meetups(db: Session, product_id: str):
-    return db.query(models.Meetup).filter(models.Meetup.product_id == product_id).all()
+def get_product_meetups(db: Session, product_id: str, user_id: str, limit: int = 100, cursor: Optional[str] = None):
+    """Get a page of a product's meetups where `user_id` is the buyer or the seller"""
+    query = db.query(models.Meetup).filter(
+        models.Meetup.product_id == product_id,
+        or_(models.Meetup.buyer_id == user_id, models.Meetup.seller_id == user_id)
+    )
+    return paginate(query, models.Meetup, limit=limit, cursor=cursor)
 
 def update_meetup_status(db: Session, meetup_id: str, status: models.MeetupStatus):
     db_meetup = get_meetup(db, meetup_id)
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from features.authentication.models import User
-from features.authentication.auth_jwt import get_current_user
+from features.authentication.auth_jwt import CurrentUser, get_current_user
 from database import get_db
+from pagination import set_next_cursor
+from idempotency import IDEMPOTENCY_KEY_HEADER, run_idempotent
 from . import schemas, crud, models
 from .meetup_crud import (
     create_meetup as create_meetup_db,
@@ -21,60 +22,80 @@ router = APIRouter(prefix="/meetups", tags=["meetups"])
 @router.post("/", response_model=schemas.MeetupRead)
 def create_meetup(
     meetup: schemas.MeetupCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER, max_length=255),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Create a new meetup request"""
+    """Create a new meetup request, retries with the same Idempotency-Key return the first meetup"""
     try:
-        return create_meetup_db(db, meetup, current_user.id)
+        return run_idempotent(
+            db, idempotency_key, current_user.id, "POST /meetups/", meetup, schemas.MeetupRead,
+            lambda: create_meetup_db(db, meetup, current_user.id)
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/", response_model=List[schemas.MeetupRead])
 def get_meetups(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Get all meetups (admin only)"""
     # This endpoint could be restricted to admins in a real application
-    return get_meetups_db(db, skip, limit)
+    meetups, next_cursor = get_meetups_db(db, skip, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return meetups
 
 @router.get("/buyer", response_model=List[schemas.MeetupRead])
 def get_buyer_meetups(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Get all meetups where the current user is the buyer"""
-    return get_buyer_meetups_db(db, current_user.id)
+    """Get the meetups where the current user is the buyer, newest first"""
+    meetups, next_cursor = get_buyer_meetups_db(db, current_user.id, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return meetups
 
 @router.get("/seller", response_model=List[schemas.MeetupRead])
 def get_seller_meetups(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Get all meetups where the current user is the seller"""
+    """Get the meetups where the current user is the seller, newest first"""
     from .meetup_crud import get_seller_meetups as get_seller_meetups_db
-    return get_seller_meetups_db(db, current_user.id)
+    meetups, next_cursor = get_seller_meetups_db(db, current_user.id, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return meetups
 
 @router.get("/product/{product_id}", response_model=List[schemas.MeetupRead])
 def get_product_meetups(
     product_id: str,
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Get all meetups for a specific product"""
-    meetups = get_product_meetups_db(db, product_id)
-    
-    # Only return meetups where the current user is either the buyer or seller
-    return [m for m in meetups if m.buyer_id == current_user.id or m.seller_id == current_user.id]
+    """Get the meetups for a specific product where the current user is either the buyer or seller"""
+    meetups, next_cursor = get_product_meetups_db(db, product_id, current_user.id, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return meetups
 
 @router.get("/{meetup_id}", response_model=schemas.MeetupRead)
 def get_meetup(
     meetup_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Get a specific meetup"""
     meetup = get_meetup_db(db, meetup_id)
@@ -94,7 +115,7 @@ def get_meetup(
 def accept_meetup(
     meetup_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Accept a meetup request (seller only)"""
     meetup = get_meetup_db(db, meetup_id)
@@ -121,7 +142,7 @@ def accept_meetup(
 def reject_meetup(
     meetup_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Reject a meetup request (seller only)"""
     meetup = get_meetup_db(db, meetup_id)
@@ -148,7 +169,7 @@ def reject_meetup(
 def delete_meetup(
     meetup_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Delete a meetup"""
     meetup = get_meetup_db(db, meetup_id)
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Enum, Integer, ARRAY       
+from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Enum, Integer, ARRAY, Index, Computed, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from database import Base
+from geo import GEOHASH_PRECISION
 import enum
 from typing import Optional, List
 
@@ -15,6 +17,10 @@ class ProductStatus(str, enum.Enum):
 
 class University(Base):
     __tablename__= 'universities'
+    __table_args__ = (
+        # Nearby lookups are prefix range scans over the geohash
+        Index('ix_universities_geohash', 'geohash'),
+    )
 
     id = Column(String, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)
@@ -23,6 +29,9 @@ class University(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    # Byte-wise collation so geohash prefix ranges match the B-tree order. Deferred, only
+    # the nearby lookups filter on it and it needs migration_university_geohash.py on existing databases
+    geohash = deferred(Column(String(GEOHASH_PRECISION, collation='C'), nullable=True))
 
     # Relationships
     products = relationship("Product", back_populates="university")
@@ -30,6 +39,21 @@ class University(Base):
 
 class Product(Base):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Keyset pages are seeks on (created_at, id), optionally behind the listing filters
+        Index('ix_products_created_at_id', 'created_at', 'id'),
+        Index('ix_products_visibility_created_at_id', 'visibility', 'created_at', 'id'),
+        Index('ix_products_university_id_created_at_id', 'university_id', 'created_at', 'id'),
+        Index('ix_products_university_id_status_created_at_id', 'university_id', 'status', 'created_at', 'id'),
+        Index('ix_products_search_vector', 'search_vector', postgresql_using='gin'),
+        # Catalog filters, the in-stock listing only indexes rows that can still be ordered
+        Index('ix_products_category_created_at_id', 'category', 'created_at', 'id'),
+        Index('ix_products_condition_created_at_id', 'condition', 'created_at', 'id'),
+        Index('ix_products_price', 'price'),
+        Index('ix_products_in_stock_created_at_id', 'created_at', 'id', postgresql_where=text('stock > 0')),
+        # A seller's storefront, filtered by visibility
+        Index('ix_products_seller_id_visibility_created_at_id', 'seller_id', 'visibility', 'created_at', 'id'),
+    )
 
     id = Column(String, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -48,6 +72,13 @@ class Product(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     avg_rating = Column(Float, nullable=False, server_default='0')
     num_of_ratings = Column(Integer, nullable=False, server_default='0')
+    # Maintained by PostgreSQL for keyword search, title matches rank above description/category
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'C')",
+        persisted=True
+    )))
 
     # Relationships
     seller = relationship("User", back_populates="products")
@@ -56,6 +87,13 @@ class Product(Base):
 
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        Index('ix_orders_created_at_id', 'created_at', 'id'),
+        # Lets product deletes check for orders with an index probe
+        Index('ix_orders_product_id', 'product_id'),
+        Index('ix_orders_buyer_id_created_at_id', 'buyer_id', 'created_at', 'id'),
+        Index('ix_orders_seller_id_created_at_id', 'seller_id', 'created_at', 'id'),
+    )
 
     id = Column(String, primary_key=True, index=True)
     product_id = Column(String, ForeignKey('products.id'), nullable=False)
@@ -77,6 +115,12 @@ class MeetupStatus(str, enum.Enum):
 
 class Meetup(Base):
     __tablename__ = 'meetups'
+    __table_args__ = (
+        Index('ix_meetups_created_at_id', 'created_at', 'id'),
+        Index('ix_meetups_buyer_id_created_at_id', 'buyer_id', 'created_at', 'id'),
+        Index('ix_meetups_seller_id_created_at_id', 'seller_id', 'created_at', 'id'),
+        Index('ix_meetups_product_id_created_at_id', 'product_id', 'created_at', 'id'),
+    )
 
     id = Column(String, primary_key=True, index=True)
     buyer_id = Column(String, ForeignKey('users.id'), nullable=False)
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from features.authentication.models import User
-from features.authentication.auth_jwt import get_current_user
+from features.authentication.auth_jwt import CurrentUser, get_current_user
 from database import get_db
+from pagination import set_next_cursor
+from idempotency import IDEMPOTENCY_KEY_HEADER, run_idempotent
 from . import schemas, crud, models
 
 router = APIRouter(prefix="/orders", tags=["orders"])
@@ -12,10 +13,11 @@ router = APIRouter(prefix="/orders", tags=["orders"])
 @router.post("/", response_model=schemas.OrderRead)
 def create_order(
     order: schemas.OrderCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER, max_length=255),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Create a new order"""
+    """Create a new order, retries with the same Idempotency-Key return the first order"""
     try:
         # Verify that the buyer is not the seller
         if order.seller_id == current_user.id:
@@ -24,42 +26,80 @@ def create_order(
                 detail="You cannot order your own product"
             )
         
-        return crud.create_order(db, order, current_user.id)
+        return run_idempotent(
+            db, idempotency_key, current_user.id, "POST /orders/", order, schemas.OrderRead,
+            lambda: crud.create_order(db, order, current_user.id)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/batch", response_model=List[schemas.OrderRead])
+def create_orders(
+    batch: schemas.OrderBatchCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER, max_length=255),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Check out a cart: create one order per item, all in a single transaction"""
+    if any(order.seller_id == current_user.id for order in batch.items):
+        raise HTTPException(
+            status_code=400,
+            detail="You cannot order your own product"
+        )
+    try:
+        return run_idempotent(
+            db, idempotency_key, current_user.id, "POST /orders/batch", batch, List[schemas.OrderRead],
+            lambda: crud.create_orders(db, batch.items, current_user.id)
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/", response_model=List[schemas.OrderRead])
 def get_orders(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Get all orders (admin only)"""
     # TODO: Add admin check here
-    return crud.get_orders(db, skip, limit)
+    orders, next_cursor = crud.get_orders(db, skip, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return orders
 
 @router.get("/me/purchases", response_model=List[schemas.OrderRead])
 def get_my_purchases(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Get all orders made by the current user"""
-    return crud.get_buyer_orders(db, current_user.id)
+    """Get the orders made by the current user, newest first"""
+    orders, next_cursor = crud.get_buyer_orders(db, current_user.id, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return orders
 
 @router.get("/me/sales", response_model=List[schemas.OrderRead])
 def get_my_sales(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Get all orders for products sold by the current user"""
-    return crud.get_seller_orders(db, current_user.id)
+    """Get the orders for products sold by the current user, newest first"""
+    orders, next_cursor = crud.get_seller_orders(db, current_user.id, limit, cursor)
+    set_next_cursor(response, next_cursor)
+    return orders
 
 @router.get("/{order_id}", response_model=schemas.OrderRead)
 def get_order(
     order_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Get a specific order"""
     order = crud.get_order(db, order_id)
@@ -80,7 +120,7 @@ def update_order(
     order_id: str,
     order: schemas.OrderUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Update an order (only quantity can be updated)"""
     db_order = crud.get_order(db, order_id)
@@ -103,7 +143,7 @@ def update_order(
 def delete_order(
     order_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Cancel an order"""
     db_order = crud.get_order(db, order_id)
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from features.authentication.models import User
-from features.authentication.auth_jwt import get_current_user
+from features.authentication.auth_jwt import CurrentUser, get_current_user
 from database import get_db
+from pagination import set_next_cursor
 from . import schemas, crud, models
 
 router = APIRouter(prefix="/products", tags=["products"])
@@ -13,7 +13,7 @@ router = APIRouter(prefix="/products", tags=["products"])
 def create_product(
     product: schemas.ProductCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Create a new product"""
     try:
@@ -23,20 +23,65 @@ def create_product(
 
 @router.get("/", response_model=List[schemas.ProductRead])
 def get_products(
+    response: Response,
     university_id: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    filters: schemas.ProductFilter = Depends(),
     db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user)
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """Get all products with university and visibility filtering"""
-    return crud.get_products(db, skip, limit, university_id, current_user)
+    """Get a page of products with university, visibility and catalog filtering"""
+    products, next_cursor = crud.get_products(db, skip, limit, university_id, current_user, cursor, filters)
+    set_next_cursor(response, next_cursor)
+    return products
+
+@router.get("/search", response_model=List[schemas.ProductRead])
+def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    university_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(20, ge=1, le=100),
+    filters: schemas.ProductFilter = Depends(),
+    db: Session = Depends(get_db),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """Keyword search over accepted products, ranked by relevance"""
+    return crud.search_products(db, q, skip, limit, university_id, current_user, filters)
+
+@router.get("/nearby", response_model=List[schemas.ProductNearbyRead])
+def get_nearby_products(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(25, gt=0, le=500, description="Search radius in kilometres"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=100),
+    filters: schemas.ProductFilter = Depends(),
+    db: Session = Depends(get_db),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """Get the products of universities within `radius` km of a point, nearest first"""
+    return [
+        schemas.ProductNearbyRead(**schemas.ProductRead.model_validate(product).model_dump(), distance_km=distance)
+        for product, distance in crud.get_nearby_products(db, lat, lon, radius, skip, limit, current_user, filters)
+    ]
+
+@router.get("/facets", response_model=schemas.ProductFacets)
+def get_product_facets(
+    university_id: Optional[str] = None,
+    filters: schemas.ProductFilter = Depends(),
+    db: Session = Depends(get_db),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """Get product counts per category and condition for the catalog filters"""
+    return crud.get_product_facets(db, university_id, current_user, filters)
 
 @router.get("/{product_id}", response_model=schemas.ProductRead)
 def get_product(
     product_id: str,
     db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user)
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
     """Get a specific product"""
     product = crud.get_product(db, product_id)
@@ -58,7 +103,7 @@ def update_product(
     product_id: str,
     product: schemas.ProductUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Update a product"""
     db_product = crud.get_product(db, product_id)
@@ -80,7 +125,7 @@ def update_product(
 def delete_product(
     product_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Delete a product"""
     db_product = crud.get_product(db, product_id)
@@ -93,28 +138,22 @@ def delete_product(
             detail="Not authorized to delete this product"
         )
     
-    crud.delete_product(db, product_id)
+    try:
+        crud.delete_product(db, product_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Product deleted successfully"} 
 
 @router.get("/seller/{seller_id}", response_model=List[schemas.ProductRead])
 def get_products_by_seller(
     seller_id: str,
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user)
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """Get all products from a specific seller"""
-    products = crud.get_seller_products(db, seller_id)
-    
-    # Filter products based on visibility and user's university
-    if current_user:
-        # If user is logged in, show all products from their university plus products marked as visible to all
-        visible_products = [
-            p for p in products if 
-            p.visibility == models.ProductVisibility.ALL or 
-            (p.visibility == models.ProductVisibility.UNIVERSITY_ONLY and p.university_id == current_user.university_id)
-        ]
-    else:
-        # If user is not logged in, only show products visible to all
-        visible_products = [p for p in products if p.visibility == models.ProductVisibility.ALL]
-    
-    return visible_products
\ No newline at end of file
+    """Get a page of the products from a specific seller, visibility is filtered in the query"""
+    products, next_cursor = crud.get_seller_products(db, seller_id, limit, cursor, current_user)
+    set_next_cursor(response, next_cursor)
+    return products
\ No newline at end of file
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 from .models import ProductVisibility, ProductStatus, MeetupStatus
 
 class UniversityBase(BaseModel):
@@ -22,6 +22,9 @@ class UniversityRead(UniversityBase):
     class Config:
         from_attributes = True
 
+class UniversityNearbyRead(UniversityRead):
+    distance_km: float
+
 class ProductBase(BaseModel):
     title: str
     description: str
@@ -69,6 +72,22 @@ class ProductRead(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductNearbyRead(ProductRead):
+    distance_km: float
+
+class ProductFilter(BaseModel):
+    category: Optional[str] = None
+    condition: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: Optional[bool] = None
+    min_rating: Optional[float] = None
+
+class ProductFacets(BaseModel):
+    total: int
+    category: Dict[str, int]
+    condition: Dict[str, int]
+
 class OrderBase(BaseModel):
     product_id: str
     quantity: int
@@ -77,6 +96,9 @@ class OrderBase(BaseModel):
 class OrderCreate(OrderBase):
     pass
 
+class OrderBatchCreate(BaseModel):
+    items: List[OrderCreate] = Field(..., min_length=1, max_length=50)
+
 class OrderUpdate(BaseModel):
     quantity: Optional[int] = None
 
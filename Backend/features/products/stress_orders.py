@@ -0,0 +1,152 @@
+"""Concurrency stress test for order stock reservation.
+
+Fires many parallel orders at a single product, each on its own session,
+and checks that exactly `stock` of them succeed and the stock ends at 0.
+Then cancels one order from many threads at once and checks its stock is
+restored exactly once. Runs against DATABASE_URL on scratch rows that are
+removed afterwards. From the Backend directory:
+
+    python -m features.products.stress_orders --orders 300 --stock 50
+"""
+import argparse
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+from features.authentication.models import User
+# Registers the models the User relationships refer to
+import features.Role_access.models  # noqa: F401
+from . import crud, models, schemas
+
+
+def _create_fixtures(session_factory, stock: int) -> dict:
+    suffix = uuid.uuid4().hex[:12]
+    ids = {
+        "university": f"stress-{suffix}",
+        "seller": f"stress-seller-{suffix}",
+        "buyer": f"stress-buyer-{suffix}",
+        "product": f"stress-product-{suffix}",
+    }
+    db = session_factory()
+    try:
+        db.add(models.University(
+            id=ids["university"], name=f"Stress test {suffix}", email=f"{suffix}@stress.invalid",
+            latitude=0, longitude=0
+        ))
+        for role in ("seller", "buyer"):
+            db.add(User(
+                id=ids[role], email=f"{role}-{suffix}@stress.invalid", username=ids[role],
+                first_name="Stress", last_name="Test", hashed_password="!", university_id=ids["university"]
+            ))
+        db.flush()
+        db.add(models.Product(
+            id=ids["product"], title="Stress test product", description="Stress test product",
+            price=1, seller_id=ids["seller"], category="stress", condition="new", location="nowhere",
+            university_id=ids["university"], stock=stock
+        ))
+        db.commit()
+    finally:
+        db.close()
+    return ids
+
+
+def _remove_fixtures(session_factory, ids: dict):
+    db = session_factory()
+    try:
+        db.query(models.Order).filter(models.Order.product_id == ids["product"]).delete(synchronize_session=False)
+        db.query(models.Product).filter(models.Product.id == ids["product"]).delete(synchronize_session=False)
+        db.query(User).filter(User.id.in_([ids["seller"], ids["buyer"]])).delete(synchronize_session=False)
+        db.query(models.University).filter(models.University.id == ids["university"]).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _stock(session_factory, product_id: str) -> int:
+    db = session_factory()
+    try:
+        return db.query(models.Product.stock).filter(models.Product.id == product_id).scalar()
+    finally:
+        db.close()
+
+
+def _place_order(session_factory, ids: dict) -> bool:
+    db = session_factory()
+    try:
+        crud.create_order(
+            db, schemas.OrderCreate(product_id=ids["product"], seller_id=ids["seller"], quantity=1), ids["buyer"]
+        )
+        return True
+    except ValueError:
+        return False
+    finally:
+        db.close()
+
+
+def _cancel_order(session_factory, order_id: str) -> bool:
+    db = session_factory()
+    try:
+        return crud.delete_order(db, order_id) is not None
+    finally:
+        db.close()
+
+
+def run(session_factory, orders: int, stock: int, workers: int, cancels: int) -> List[str]:
+    """Run both scenarios, returns the failed checks (empty if everything held)"""
+    failures = []
+    ids = _create_fixtures(session_factory, stock)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            placed = sum(pool.map(lambda _: _place_order(session_factory, ids), range(orders)))
+        remaining = _stock(session_factory, ids["product"])
+        print(f"{orders} parallel orders against a stock of {stock}: {placed} succeeded, stock left {remaining}")
+        if placed != min(orders, stock):
+            failures.append(f"expected {min(orders, stock)} orders to succeed, got {placed}")
+        if remaining != max(stock - orders, 0):
+            failures.append(f"expected a final stock of {max(stock - orders, 0)}, got {remaining}")
+
+        db = session_factory()
+        try:
+            order_id = db.query(models.Order.id).filter(models.Order.product_id == ids["product"]).limit(1).scalar()
+        finally:
+            db.close()
+        if order_id is not None:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                cancelled = sum(pool.map(lambda _: _cancel_order(session_factory, order_id), range(cancels)))
+            restored = _stock(session_factory, ids["product"]) - remaining
+            print(f"{cancels} parallel cancels of one order: {cancelled} deleted it, stock restored by {restored}")
+            if cancelled != 1:
+                failures.append(f"expected exactly one cancel to delete the order, got {cancelled}")
+            if restored != 1:
+                failures.append(f"expected the stock to be restored by 1, got {restored}")
+    finally:
+        _remove_fixtures(session_factory, ids)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test concurrent orders on one product")
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--cancels", type=int, default=20, help="parallel cancels of the same order")
+    args = parser.parse_args()
+
+    # One connection per worker, so the requests really hit the database at the same time
+    engine = create_engine(settings.DATABASE_URL, pool_size=args.workers, max_overflow=0)
+    try:
+        failures = run(sessionmaker(bind=engine), args.orders, args.stock, args.workers, args.cancels)
+    finally:
+        engine.dispose()
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from typing import List
 
-from features.authentication.models import User
-from features.authentication.auth_jwt import get_admin_user
+from features.authentication.auth_jwt import CurrentUser, get_admin_user
+from features.authentication.profile_cache import invalidate_all_user_profiles
 from database import get_db
 from . import schemas, crud
 
@@ -13,7 +13,7 @@ router = APIRouter(prefix="/universities", tags=["universities"])
 def create_university(
     university: schemas.UniversityCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: CurrentUser = Depends(get_admin_user)
 ):
     """Create a new university (admin only)"""
     # Check if university with same email already exists
@@ -34,6 +34,19 @@ def get_universities(
     """Get all universities"""
     return crud.get_all_universities(db, skip, limit)
 
+@router.get("/nearby", response_model=List[schemas.UniversityNearbyRead])
+def get_nearby_universities(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(25, gt=0, le=500, description="Search radius in kilometres"),
+    db: Session = Depends(get_db)
+):
+    """Get the universities within `radius` km of a point, nearest first"""
+    return [
+        schemas.UniversityNearbyRead(**schemas.UniversityRead.model_validate(university).model_dump(), distance_km=distance)
+        for university, distance in crud.get_nearby_universities(db, lat, lon, radius)
+    ]
+
 @router.get("/{university_id}", response_model=schemas.UniversityRead)
 def get_university(
     university_id: str,
@@ -50,7 +63,7 @@ def update_university(
     university_id: str,
     university: schemas.UniversityCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: CurrentUser = Depends(get_admin_user)
 ):
     """Update a university (admin only)"""
     db_university = crud.get_university(db, university_id)
@@ -67,30 +80,22 @@ def update_university(
             )
     
     # Update university
-    db_university.name = university.name
-    db_university.email = university.email
-    db.commit()
-    db.refresh(db_university)
+    db_university = crud.update_university(db, db_university, university)
+    # Cached user profiles embed their university
+    invalidate_all_user_profiles()
     return db_university
 
 @router.delete("/{university_id}")
 def delete_university(
     university_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: CurrentUser = Depends(get_admin_user)
 ):
     """Delete a university (admin only)"""
-    db_university = crud.get_university(db, university_id)
-    if not db_university:
+    try:
+        deleted = crud.delete_university(db, university_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
         raise HTTPException(status_code=404, detail="University not found")
-    
-    # Check if university has any associated products or users
-    if db_university.products or db_university.users:
-        raise HTTPException(
-            status_code=400,
-            detail="Cannot delete university with associated products or users"
-        )
-    
-    db.delete(db_university)
-    db.commit()
     return {"message": "University deleted successfully"}
\ No newline at end of file
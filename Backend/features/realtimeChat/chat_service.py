@@ -1,32 +1,28 @@
 from datetime import datetime
-from typing import List, Optional, Callable, Dict
-from database import get_db
-from firebase_config import db
-import uuid
-from features.authentication.schemas import UserRead
-from features.authentication.models import User
-from sqlalchemy.orm import Session
+from typing import List, Optional, Dict, Tuple
+import asyncio
+import os
+import threading
+from fastapi.concurrency import run_in_threadpool
+from pagination import encode_cursor
+from features.authentication.auth_jwt import CurrentUser
+from features.authentication.profile_cache import get_user_profiles
+from .hub import ChatHub, chat_hub
+from .store import ChatStore, FirebaseChatStore, InMemoryChatStore, SQLChatStore, MessageKey
+
 
 class ChatService:
-    def __init__(self):
-        self.chats_ref = db.child('chats')
-        self.messages_ref = db.child('messages')
-        self._subscribers: Dict[str, List[Callable]] = {}
-
-    def _user_to_read(self, user: User) -> UserRead:
-        """Convert a User model to UserRead schema"""
-        return UserRead(
-            id=user.id,
-            email=user.email,
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            phone_no=user.phone_no,
-            gender=user.gender,
-            role=user.role,
-            created_at=user.created_at.isoformat() if user.created_at else None,
-            university=user.university
-        )
+    def __init__(self, store: ChatStore, hub: ChatHub):
+        self.store = store
+        self.hub = hub
+
+    async def _get_user_profiles(self, user_ids) -> Dict[str, dict]:
+        """Load user profiles without blocking the event loop on a cache miss"""
+        return await run_in_threadpool(get_user_profiles, list(user_ids))
+
+    def _participants_data(self, participant_ids: List[str], profiles: Dict[str, dict]) -> List[dict]:
+        """Pick the profiles of a chat's participants, skipping users that no longer exist"""
+        return [profiles[user_id] for user_id in participant_ids if user_id in profiles]
 
     def _convert_datetime_to_iso(self, data: dict) -> dict:
         """Convert all datetime objects in a dict to ISO format strings"""
@@ -39,27 +35,18 @@ class ChatService:
                 data[key] = [self._convert_datetime_to_iso(item) if isinstance(item, dict) else item for item in value]
         return data
 
-    def _notify_subscribers(self, chat_id: str, update: dict):
-        """Notify all subscribers of a chat about an update"""
-        if chat_id in self._subscribers:
-            for callback in self._subscribers[chat_id]:
-                try:
-                    callback(update)
-                except Exception as e:
-                    print(f"Error notifying subscriber: {e}")
+    async def _notify_participants(self, participant_ids: List[str], update: dict):
+        """Push a chat list update to the user topics of the chat's participants"""
+        for user_id in set(participant_ids):
+            await self.hub.publish(f'user:{user_id}', update)
 
-    async def create_chat_room(self, name: str, is_group: bool, participant_ids: List[str], current_user: User) -> dict:
+    async def create_chat_room(self, name: str, is_group: bool, participant_ids: List[str], current_user: CurrentUser) -> dict:
         # Get user data for participants
-        participants_data = []
-        for user_id in participant_ids:
-            # Get a new database session
-            db = next(get_db())
-            try:
-                user = db.query(User).filter(User.id == user_id).first()
-                if user:
-                    participants_data.append(self._user_to_read(user).dict())
-            finally:
-                db.close()
+        profiles = await self._get_user_profiles(participant_ids)
+        unknown_ids = [user_id for user_id in dict.fromkeys(participant_ids) if user_id not in profiles]
+        if unknown_ids:
+            raise ValueError(f"Unknown participant ids: {', '.join(unknown_ids)}")
+        participants_data = self._participants_data(participant_ids, profiles)
 
         chat_data = {
             'name': name,
@@ -75,67 +62,84 @@ class ChatService:
         # Convert all datetime objects to ISO format strings
         chat_data = self._convert_datetime_to_iso(chat_data)
         
-        chat_ref = self.chats_ref.push(chat_data)
-        chat_id = chat_ref.key
-        
-        # Notify subscribers about the new chat
-        self._notify_subscribers(chat_id, {'id': chat_id, **chat_data})
+        chat_id = await self.store.create_chat(chat_data, participant_ids)
+
+        # Notify participants about the new chat
+        await self._notify_participants(participant_ids, {'id': chat_id, **chat_data})
         
         return {'id': chat_id, **chat_data}
 
-    async def get_chat_room(self, chat_id: str, current_user: User) -> Optional[dict]:
-        chat_data = self.chats_ref.child(chat_id).get()
+    async def get_chat_room(self, chat_id: str, current_user: CurrentUser, with_unread_count: bool = False) -> Optional[dict]:
+        if with_unread_count:
+            chat_data, unread_count = await asyncio.gather(
+                self.store.get_chat(chat_id),
+                self.store.get_unread_count(current_user.id, chat_id)
+            )
+        else:
+            chat_data = await self.store.get_chat(chat_id)
         if chat_data:
             # Check if user is a participant
             if current_user.id not in chat_data.get('participant_ids', []):
                 return None
                 
             # Get full participant data
-            participants_data = []
-            for participant_id in chat_data.get('participant_ids', []):
-                # Get a new database session
-                db = next(get_db())
-                try:
-                    user = db.query(User).filter(User.id == participant_id).first()
-                    if user:
-                        participants_data.append(self._user_to_read(user).dict())
-                finally:
-                    db.close()
-            chat_data['participants'] = participants_data
-            
+            participant_ids = chat_data.get('participant_ids', [])
+            chat_data['participants'] = self._participants_data(
+                participant_ids, await self._get_user_profiles(participant_ids)
+            )
+            if with_unread_count:
+                chat_data['unread_count'] = unread_count
+
             return {'id': chat_id, **chat_data}
         return None
 
-    async def get_user_chats(self, current_user: User) -> List[dict]:
-        all_chats = self.chats_ref.get() or {}
+    async def get_user_chats(self, current_user: CurrentUser) -> List[dict]:
+        chat_ids = await self.store.get_user_chat_ids(current_user.id)
+        # The chats and the user's unread counters are fetched concurrently
+        user_chats, unread_counts = await asyncio.gather(
+            self.store.get_chats(chat_ids),
+            self.store.get_unread_counts(current_user.id)
+        )
+
+        # Load the participants of all chats at once
+        profiles = await self._get_user_profiles(
+            participant_id
+            for chat_data in user_chats.values()
+            for participant_id in chat_data.get('participant_ids', [])
+        )
+
         chat_list = []
-        for chat_id, chat_data in all_chats.items():
-            if current_user.id in chat_data.get('participant_ids', []):
-                # Ensure we have the full participant data
-                if 'participant_ids' in chat_data:
-                    participants_data = []
-                    for participant_id in chat_data['participant_ids']:
-                        # Get a new database session
-                        db = next(get_db())
-                        try:
-                            user = db.query(User).filter(User.id == participant_id).first()
-                            if user:
-                                participants_data.append(self._user_to_read(user).dict())
-                        finally:
-                            db.close()
-                    chat_data['participants'] = participants_data
-                chat_list.append({'id': chat_id, **chat_data})
+        for chat_id, chat_data in user_chats.items():
+            # Ensure we have the full participant data
+            if 'participant_ids' in chat_data:
+                chat_data['participants'] = self._participants_data(chat_data['participant_ids'], profiles)
+            chat_data['unread_count'] = unread_counts.get(chat_id, 0)
+            chat_list.append({'id': chat_id, **chat_data})
         return chat_list
 
-    async def send_message(self, chat_id: str, current_user: User, content: Optional[str] = None, image_url: Optional[str] = None) -> dict:
+    async def send_message(
+        self,
+        chat_id: str,
+        current_user: CurrentUser,
+        content: Optional[str] = None,
+        image_url: Optional[str] = None,
+        participant_ids: Optional[List[str]] = None
+    ) -> dict:
+        if participant_ids is None:
+            sender_profiles, participant_ids = await asyncio.gather(
+                self._get_user_profiles([current_user.id]),
+                self.store.get_participant_ids(chat_id)
+            )
+        else:
+            sender_profiles = await self._get_user_profiles([current_user.id])
+
         message_data = {
             'chat_id': chat_id,
             'sender_id': current_user.id,
             'content': content,
             'created_at': datetime.now(),
-            'is_read': False,
             'type': 'text' if content else 'image',
-            'sender': self._user_to_read(current_user).dict()  # Include sender data
+            'sender': sender_profiles.get(current_user.id)  # Include sender data
         }
 
         # Handle image URL if present
@@ -146,83 +150,94 @@ class ChatService:
         # Convert all datetime objects to ISO format strings
         message_data = self._convert_datetime_to_iso(message_data)
 
-        message_ref = self.messages_ref.push(message_data)
-        message_id = message_ref.key
-        
         # Update chat's last message and timestamp
-        update_data = {
+        chat_update = self._convert_datetime_to_iso({
             'updated_at': datetime.now(),
             'last_message': content if content else 'Image',
             'last_message_time': datetime.now()
-        }
-        
-        # Convert update data datetime objects to ISO format strings
-        update_data = self._convert_datetime_to_iso(update_data)
-        
-        self.chats_ref.child(chat_id).update(update_data)
-        
-        # Notify subscribers about the new message
-        self._notify_subscribers(chat_id, {'id': message_id, **message_data})
+        })
+
+        recipient_ids = [user_id for user_id in set(participant_ids) if user_id != current_user.id]
+        message_id = await self.store.add_message(chat_id, message_data, chat_update, recipient_ids)
+
+        message = {'id': message_id, 'is_read': False, **message_data}
+
+        # Notify the room about the new message and the participants' chat lists about the new summary
+        await self.hub.publish(f'chat:{chat_id}', message)
+        await self._notify_participants(participant_ids, {'id': chat_id, **chat_update})
+
+        return message
+
+    async def get_chat_messages(
+        self,
+        chat_id: str,
+        current_user: CurrentUser,
+        limit: int = 50,
+        before: Optional[MessageKey] = None,
+        after: Optional[MessageKey] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Get one page of a chat's messages, newest first, plus the cursor of the next page.
+
+        `before`/`after` are (created_at, message_id) keys of the message the
+        page continues from. Without a cursor the latest messages are returned.
+        """
+        # One extra message tells us whether there is another page
+        page, read_markers = await asyncio.gather(
+            self.store.list_messages(chat_id, limit + 1, before=before, after=after),
+            self.store.get_read_markers(chat_id)
+        )
+        has_more = len(page) > limit
+        page = page[:limit] if after else page[-limit:]
 
-        return {'id': message_id, **message_data}
+        next_cursor = None
+        if has_more and page:
+            # Continue after the newest message when paging forward, before the oldest otherwise
+            msg_id, msg_data = page[-1] if after else page[0]
+            next_cursor = encode_cursor(msg_data['created_at'], msg_id)
 
-    async def get_chat_messages(self, chat_id: str, current_user: User, limit: int = 50) -> List[dict]:
-        all_messages = self.messages_ref.get() or {}
+        # Get sender data for the whole page at once
+        senders = await self._get_user_profiles(msg_data['sender_id'] for _, msg_data in page)
         message_list = []
-        for msg_id, msg_data in all_messages.items():
-            if msg_data.get('chat_id') == chat_id:
-                # Get sender data
-                db = next(get_db())
-                try:
-                    sender = db.query(User).filter(User.id == msg_data['sender_id']).first()
-                    if sender:
-                        msg_data['sender'] = self._user_to_read(sender).dict()
-                finally:
-                    db.close()
-                message_list.append({'id': msg_id, **msg_data})
-        
-        # Sort by created_at and limit
-        message_list.sort(key=lambda x: x['created_at'], reverse=True)
-        return message_list[:limit]
+        for msg_id, msg_data in page:
+            if msg_data['sender_id'] in senders:
+                msg_data['sender'] = senders[msg_data['sender_id']]
+            # A message is read once another participant's marker has passed it
+            msg_data['is_read'] = any(
+                marker.get('last_read_at', '') >= msg_data['created_at']
+                for user_id, marker in read_markers.items()
+                if user_id != msg_data['sender_id']
+            )
+            message_list.append({'id': msg_id, **msg_data})
+
+        # Newest first
+        message_list.reverse()
+        return message_list, next_cursor
 
     async def mark_messages_as_read(self, chat_id: str, user_id: str):
-        all_messages = self.messages_ref.get() or {}
-        updates = {}
-        for msg_id, msg_data in all_messages.items():
-            if (msg_data.get('chat_id') == chat_id and 
-                msg_data.get('sender_id') != user_id and 
-                not msg_data.get('is_read', False)):
-                updates[f'{msg_id}/is_read'] = True
-        
-        if updates:
-            self.messages_ref.update(updates)
-
-    def subscribe_to_chat(self, chat_id: str, callback: Callable):
-        """Subscribe to real-time updates for a specific chat room"""
-        if chat_id not in self._subscribers:
-            self._subscribers[chat_id] = []
-        self._subscribers[chat_id].append(callback)
-
-    def subscribe_to_user_chats(self, user_id: str, callback: Callable):
-        """Subscribe to real-time updates for all chats a user is part of"""
-        # Get all chats for the user
-        all_chats = self.chats_ref.get() or {}
-        for chat_id, chat_data in all_chats.items():
-            if user_id in chat_data.get('participant_ids', []):
-                self.subscribe_to_chat(chat_id, callback)
-
-    def unsubscribe_from_chat(self, chat_id: str, callback: Callable):
-        """Unsubscribe from real-time updates for a specific chat room"""
-        if chat_id in self._subscribers:
-            self._subscribers[chat_id] = [cb for cb in self._subscribers[chat_id] if cb != callback]
-            if not self._subscribers[chat_id]:
-                del self._subscribers[chat_id]
-
-    def unsubscribe_from_user_chats(self, user_id: str, callback: Callable):
-        """Unsubscribe from real-time updates for all chats a user is part of"""
-        all_chats = self.chats_ref.get() or {}
-        for chat_id, chat_data in all_chats.items():
-            if user_id in chat_data.get('participant_ids', []):
-                self.unsubscribe_from_chat(chat_id, callback)
-
-chat_service = ChatService()
\ No newline at end of file
+        """Move the user's read marker to now and reset their unread counter in one write"""
+        await self.store.mark_read(chat_id, user_id, datetime.now().isoformat())
+
+
+def create_chat_store() -> ChatStore:
+    """Pick the chat storage backend from CHAT_STORE: firebase (default), sql or memory"""
+    backend = os.getenv("CHAT_STORE", "firebase")
+    if backend == "memory":
+        return InMemoryChatStore()
+    if backend == "sql":
+        return SQLChatStore()
+    from firebase_config import get_db_reference
+    return FirebaseChatStore(get_db_reference(), max_workers=int(os.getenv("CHAT_STORE_MAX_WORKERS", "16")))
+
+
+_chat_service: Optional[ChatService] = None
+_chat_service_lock = threading.Lock()
+
+
+def get_chat_service() -> ChatService:
+    """Get the chat service singleton, creating it (and its store) on first use"""
+    global _chat_service
+    if _chat_service is None:
+        with _chat_service_lock:
+            if _chat_service is None:
+                _chat_service = ChatService(create_chat_store(), chat_hub)
+    return _chat_service
\ No newline at end of file
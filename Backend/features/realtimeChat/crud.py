@@ -1 +1,179 @@
- 
\ No newline at end of file
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, selectinload
+from . import models
+
+# Chat and message dicts use the same shape as the Firebase store, with ISO format timestamps
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _format_datetime(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _chat_to_dict(chat: models.Chat) -> dict:
+    return {
+        'name': chat.name,
+        'is_group': chat.is_group,
+        'participant_ids': [participant.user_id for participant in chat.participants],
+        'created_at': _format_datetime(chat.created_at),
+        'updated_at': _format_datetime(chat.updated_at),
+        'last_message': chat.last_message,
+        'last_message_time': _format_datetime(chat.last_message_time)
+    }
+
+
+def _message_to_dict(message: models.ChatMessage) -> dict:
+    message_data = {
+        'chat_id': message.chat_id,
+        'sender_id': message.sender_id,
+        'content': message.content,
+        'created_at': _format_datetime(message.created_at),
+        'type': message.type
+    }
+    if message.image_url:
+        message_data['image_url'] = message.image_url
+    return message_data
+
+
+def create_chat(db: Session, chat_id: str, chat_data: dict, participant_ids: List[str]):
+    db.add(models.Chat(
+        id=chat_id,
+        name=chat_data['name'],
+        is_group=chat_data['is_group'],
+        created_at=_parse_datetime(chat_data['created_at']),
+        updated_at=_parse_datetime(chat_data['updated_at'])
+    ))
+    for position, user_id in enumerate(dict.fromkeys(participant_ids)):
+        db.add(models.ChatParticipant(chat_id=chat_id, user_id=user_id, position=position))
+    db.commit()
+
+
+def get_chats(db: Session, chat_ids: List[str]) -> Dict[str, dict]:
+    if not chat_ids:
+        return {}
+    chats = (
+        db.query(models.Chat)
+        .options(selectinload(models.Chat.participants))
+        .filter(models.Chat.id.in_(chat_ids))
+        .all()
+    )
+    return {chat.id: _chat_to_dict(chat) for chat in chats}
+
+
+def get_participant_ids(db: Session, chat_id: str) -> List[str]:
+    rows = (
+        db.query(models.ChatParticipant.user_id)
+        .filter(models.ChatParticipant.chat_id == chat_id)
+        .order_by(models.ChatParticipant.position)
+        .all()
+    )
+    return [row.user_id for row in rows]
+
+
+def get_user_chat_ids(db: Session, user_id: str) -> List[str]:
+    rows = db.query(models.ChatParticipant.chat_id).filter(models.ChatParticipant.user_id == user_id).all()
+    return [row.chat_id for row in rows]
+
+
+def add_message(
+    db: Session,
+    message_id: str,
+    chat_id: str,
+    message_data: dict,
+    chat_update: dict,
+    recipient_ids: List[str]
+):
+    created_at = _parse_datetime(message_data['created_at'])
+    db.add(models.ChatMessage(
+        id=message_id,
+        chat_id=chat_id,
+        sender_id=message_data['sender_id'],
+        content=message_data.get('content'),
+        image_url=message_data.get('image_url'),
+        type=message_data['type'],
+        created_at=created_at
+    ))
+    db.query(models.Chat).filter(models.Chat.id == chat_id).update({
+        models.Chat.updated_at: _parse_datetime(chat_update['updated_at']),
+        models.Chat.last_message: chat_update['last_message'],
+        models.Chat.last_message_time: _parse_datetime(chat_update['last_message_time'])
+    }, synchronize_session=False)
+
+    # The sender has read their own message, everyone else gets an unread message
+    db.query(models.ChatParticipant).filter(
+        models.ChatParticipant.chat_id == chat_id,
+        models.ChatParticipant.user_id == message_data['sender_id']
+    ).update({
+        models.ChatParticipant.last_read_at: created_at,
+        models.ChatParticipant.unread_count: 0
+    }, synchronize_session=False)
+    if recipient_ids:
+        db.query(models.ChatParticipant).filter(
+            models.ChatParticipant.chat_id == chat_id,
+            models.ChatParticipant.user_id.in_(recipient_ids)
+        ).update(
+            {models.ChatParticipant.unread_count: models.ChatParticipant.unread_count + 1},
+            synchronize_session=False
+        )
+    db.commit()
+
+
+def list_messages(
+    db: Session,
+    chat_id: str,
+    limit: int,
+    before: Optional[Tuple[str, str]] = None,
+    after: Optional[Tuple[str, str]] = None
+) -> List[Tuple[str, dict]]:
+    """Get up to `limit` messages strictly before/after a cursor (or the latest ones), oldest first"""
+    key = tuple_(models.ChatMessage.created_at, models.ChatMessage.id)
+    query = db.query(models.ChatMessage).filter(models.ChatMessage.chat_id == chat_id)
+    if after:
+        query = query.filter(key > tuple_(_parse_datetime(after[0]), after[1]))
+        query = query.order_by(models.ChatMessage.created_at, models.ChatMessage.id)
+    else:
+        if before:
+            query = query.filter(key < tuple_(_parse_datetime(before[0]), before[1]))
+        query = query.order_by(models.ChatMessage.created_at.desc(), models.ChatMessage.id.desc())
+
+    messages = query.limit(limit).all()
+    if not after:
+        messages.reverse()
+    return [(message.id, _message_to_dict(message)) for message in messages]
+
+
+def get_read_markers(db: Session, chat_id: str) -> Dict[str, dict]:
+    rows = (
+        db.query(models.ChatParticipant.user_id, models.ChatParticipant.last_read_at)
+        .filter(
+            models.ChatParticipant.chat_id == chat_id,
+            models.ChatParticipant.last_read_at.isnot(None)
+        )
+        .all()
+    )
+    return {row.user_id: {'last_read_at': _format_datetime(row.last_read_at)} for row in rows}
+
+
+def get_unread_counts(db: Session, user_id: str, chat_id: Optional[str] = None) -> Dict[str, int]:
+    query = db.query(models.ChatParticipant.chat_id, models.ChatParticipant.unread_count).filter(
+        models.ChatParticipant.user_id == user_id
+    )
+    if chat_id:
+        query = query.filter(models.ChatParticipant.chat_id == chat_id)
+    return {row.chat_id: row.unread_count for row in query.all()}
+
+
+def mark_read(db: Session, chat_id: str, user_id: str, read_at: str):
+    db.query(models.ChatParticipant).filter(
+        models.ChatParticipant.chat_id == chat_id,
+        models.ChatParticipant.user_id == user_id
+    ).update({
+        models.ChatParticipant.last_read_at: _parse_datetime(read_at),
+        models.ChatParticipant.unread_count: 0
+    }, synchronize_session=False)
+    db.commit()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+from typing import Dict, Iterable, List, Set
+
+from fastapi import WebSocket
+
+from .pubsub import create_pubsub_backend
+
+
+class HubConnection:
+    """A WebSocket subscribed to one or more hub topics, with its own bounded send queue"""
+
+    def __init__(self, websocket: WebSocket, topics: List[str], max_queue: int):
+        self.websocket = websocket
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.writer_task = None
+
+    def offer(self, frame: str) -> bool:
+        """Queue a frame without waiting, dropping the oldest queued frame when full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.queue.put_nowait(frame)
+            self.dropped += 1
+            return False
+        self.queue.put_nowait(frame)
+        return True
+
+
+class ChatHub:
+    """Fans chat events out to WebSocket connections.
+
+    Topics are `chat:{chat_id}` for a room and `user:{user_id}` for a user's
+    chat list. Every event is serialized once, and each connection is fed by
+    its own writer task, so the sender never waits on a client. A connection
+    that drops more than `max_dropped` frames is closed as a slow consumer.
+
+    Published frames go through a pub/sub backend, which hands them to the
+    hub of every worker with connections on the topic.
+    """
+
+    def __init__(self, backend=None, max_queue: int = 100, max_dropped: int = 500):
+        self.backend = backend or create_pubsub_backend()
+        self.max_queue = max_queue
+        self.max_dropped = max_dropped
+        self._topics: Dict[str, Set[HubConnection]] = {}
+        self._started = False
+        self._start_lock = asyncio.Lock()
+        # The loop only keeps a weak reference to tasks, so the hub holds them until done
+        self._background_tasks: Set[asyncio.Task] = set()
+        self.frames_published = 0
+        self.frames_dropped = 0
+        self.slow_consumers_closed = 0
+
+    async def start(self):
+        """Start the pub/sub backend, done lazily on first use"""
+        async with self._start_lock:
+            if not self._started:
+                await self.backend.start(self.deliver)
+                self._started = True
+
+    async def stop(self):
+        if self._started:
+            await self.backend.stop()
+            self._started = False
+
+    async def connect(self, websocket: WebSocket, topics: Iterable[str]) -> HubConnection:
+        await self.start()
+        connection = HubConnection(websocket, list(topics), self.max_queue)
+        for topic in connection.topics:
+            if topic not in self._topics:
+                # First local listener, start receiving the topic from other workers
+                self._topics[topic] = set()
+                await self.backend.subscribe(topic)
+            self._topics[topic].add(connection)
+        connection.writer_task = asyncio.create_task(self._write(connection))
+        return connection
+
+    async def disconnect(self, connection: HubConnection):
+        self._unregister(connection)
+        if connection.writer_task and connection.writer_task is not asyncio.current_task():
+            connection.writer_task.cancel()
+
+    def _unregister(self, connection: HubConnection):
+        for topic in connection.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(connection)
+            if not subscribers:
+                del self._topics[topic]
+                self._spawn(self._release(topic))
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _release(self, topic: str):
+        # The topic may have been picked up again while this was scheduled
+        if topic not in self._topics:
+            try:
+                await self.backend.unsubscribe(topic)
+            except Exception as e:
+                print(f"Error unsubscribing from {topic}: {e}")
+
+    async def _write(self, connection: HubConnection):
+        try:
+            while True:
+                frame = await connection.queue.get()
+                await connection.websocket.send_text(frame)
+        except Exception as e:
+            # The client went away, stop delivering to it
+            print(f"Error writing to websocket: {e}")
+            self._unregister(connection)
+
+    async def _close_slow_consumer(self, connection: HubConnection):
+        await self.disconnect(connection)
+        try:
+            await connection.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def publish(self, topic: str, event: dict):
+        """Serialize an event once and send it to every connection subscribed to the topic, on any worker"""
+        await self.start()
+        self.frames_published += 1
+        await self.backend.publish(topic, json.dumps(event, default=str))
+
+    def deliver(self, topic: str, frame: str):
+        """Queue a frame for this worker's connections on the topic"""
+        for connection in list(self._topics.get(topic, ())):
+            if not connection.offer(frame):
+                self.frames_dropped += 1
+                if connection.dropped > self.max_dropped:
+                    # Stop feeding it right away, the close itself happens in the background
+                    self._unregister(connection)
+                    self.slow_consumers_closed += 1
+                    self._spawn(self._close_slow_consumer(connection))
+
+    def stats(self) -> dict:
+        connections = {connection for subscribers in self._topics.values() for connection in subscribers}
+        depths = [connection.queue.qsize() for connection in connections]
+        return {
+            'backend': self.backend.name,
+            'connections': len(connections),
+            'topics': len(self._topics),
+            'queue_depth_total': sum(depths),
+            'queue_depth_max': max(depths, default=0),
+            'frames_published': self.frames_published,
+            'frames_dropped': self.frames_dropped,
+            'slow_consumers_closed': self.slow_consumers_closed,
+        }
+
+
+chat_hub = ChatHub()
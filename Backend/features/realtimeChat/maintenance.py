@@ -0,0 +1,102 @@
+"""Maintenance tasks for the chat data stored in Firebase.
+
+Run from the Backend directory, e.g.:
+
+    python -m features.realtimeChat.maintenance migrate-messages
+    python -m features.realtimeChat.maintenance backfill-user-chats
+"""
+import argparse
+from firebase_config import get_db_reference
+
+BATCH_SIZE = 500
+
+
+def migrate_messages_to_chat_layout(batch_size: int = BATCH_SIZE) -> int:
+    """Move messages from the flat messages/{message_id} layout to messages/{chat_id}/{message_id}.
+
+    Safe to run more than once: already migrated chat nodes are left untouched.
+    Returns the number of messages moved.
+    """
+    messages_ref = get_db_reference().child('messages')
+    # Shallow read only returns the top-level keys, not the message bodies
+    keys = list((messages_ref.get(shallow=True) or {}).keys())
+
+    moved = 0
+    updates = {}
+    for key in keys:
+        # Old messages carry their chat_id, chat nodes under the new layout don't
+        chat_id = messages_ref.child(key).child('chat_id').get()
+        if not isinstance(chat_id, str):
+            continue
+
+        msg_data = messages_ref.child(key).get()
+        if not msg_data:
+            continue
+        updates[f'{chat_id}/{key}'] = msg_data
+        updates[key] = None
+        moved += 1
+
+        if len(updates) >= batch_size * 2:
+            # Copy and delete in the same multi-path update so no message is lost or duplicated
+            messages_ref.update(updates)
+            updates = {}
+
+    if updates:
+        messages_ref.update(updates)
+    return moved
+
+
+def backfill_user_chats(batch_size: int = BATCH_SIZE) -> int:
+    """Build the user_chats/{user_id}/{chat_id} membership index from the existing chats.
+
+    Returns the number of index entries written.
+    """
+    db = get_db_reference()
+    chats_ref = db.child('chats')
+    chat_ids = list((chats_ref.get(shallow=True) or {}).keys())
+
+    written = 0
+    updates = {}
+    for chat_id in chat_ids:
+        # Only read the participant ids, not the embedded participant profiles
+        participant_ids = chats_ref.child(chat_id).child('participant_ids').get() or []
+        for user_id in participant_ids:
+            updates[f'{user_id}/{chat_id}'] = True
+            written += 1
+
+        if len(updates) >= batch_size:
+            db.child('user_chats').update(updates)
+            updates = {}
+
+    if updates:
+        db.child('user_chats').update(updates)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat data maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-messages",
+        help="Move messages to the per-chat messages/{chat_id}/{message_id} layout"
+    )
+    migrate_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    backfill_parser = subparsers.add_parser(
+        "backfill-user-chats",
+        help="Build the user_chats/{user_id}/{chat_id} membership index"
+    )
+    backfill_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    args = parser.parse_args()
+    if args.command == "migrate-messages":
+        moved = migrate_messages_to_chat_layout(args.batch_size)
+        print(f"Moved {moved} messages")
+    elif args.command == "backfill-user-chats":
+        written = backfill_user_chats(args.batch_size)
+        print(f"Wrote {written} membership index entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,59 @@
- 
\ No newline at end of file
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, ForeignKey, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from database import Base
+
+
+class Chat(Base):
+    __tablename__ = 'chats'
+
+    id = Column(String, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    is_group = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_message = Column(String, nullable=True)
+    last_message_time = Column(DateTime(timezone=True), nullable=True)
+
+    # Relationships
+    participants = relationship("ChatParticipant", back_populates="chat", order_by="ChatParticipant.position")
+    messages = relationship("ChatMessage", back_populates="chat")
+
+
+class ChatParticipant(Base):
+    __tablename__ = 'chat_participants'
+    __table_args__ = (
+        # Membership lookup for a user's chat list
+        Index('ix_chat_participants_user_id', 'user_id'),
+    )
+
+    chat_id = Column(String, ForeignKey('chats.id'), primary_key=True)
+    user_id = Column(String, ForeignKey('users.id'), primary_key=True)
+    # Keeps participant_ids in the order the chat was created with
+    position = Column(Integer, nullable=False, default=0)
+    last_read_at = Column(DateTime(timezone=True), nullable=True)
+    unread_count = Column(Integer, nullable=False, server_default='0')
+
+    # Relationships
+    chat = relationship("Chat", back_populates="participants")
+
+
+class ChatMessage(Base):
+    __tablename__ = 'messages'
+    __table_args__ = (
+        # Message pages are range scans over a single chat
+        Index('ix_messages_chat_id_created_at', 'chat_id', 'created_at', 'id'),
+        # Lets user deletes check for sent messages with an index probe
+        Index('ix_messages_sender_id', 'sender_id'),
+    )
+
+    id = Column(String, primary_key=True)
+    chat_id = Column(String, ForeignKey('chats.id'), nullable=False)
+    sender_id = Column(String, ForeignKey('users.id'), nullable=False)
+    content = Column(String, nullable=True)
+    image_url = Column(String, nullable=True)
+    type = Column(String, nullable=False, default='text')
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    # Relationships
+    chat = relationship("Chat", back_populates="messages")
@@ -0,0 +1,103 @@
+import asyncio
+import os
+from typing import Callable, Optional
+
+# Called with (topic, frame) for every frame that should reach local connections
+DeliverCallback = Callable[[str, str], None]
+
+
+class InProcessPubSub:
+    """Delivers frames straight to this process' hub, only correct with a single worker"""
+
+    name = "in-process"
+
+    def __init__(self):
+        self._deliver: Optional[DeliverCallback] = None
+
+    async def start(self, deliver: DeliverCallback):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    async def subscribe(self, topic: str):
+        pass
+
+    async def unsubscribe(self, topic: str):
+        pass
+
+    async def publish(self, topic: str, frame: str):
+        self._deliver(topic, frame)
+
+
+class RedisPubSub:
+    """Shares frames between workers and hosts over Redis (or any server speaking its pub/sub protocol).
+
+    A worker only subscribes to the topics its own connections listen to, so
+    it doesn't receive traffic for rooms nobody on it has open. Needs the
+    `redis` package.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, channel_prefix: str = "chat-hub:"):
+        self.url = url
+        self.channel_prefix = channel_prefix
+        self._redis = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._deliver: Optional[DeliverCallback] = None
+
+    async def start(self, deliver: DeliverCallback):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CHAT_PUBSUB_URL is set but the redis package is not installed (pip install redis)")
+
+        self._deliver = deliver
+        self._redis = redis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+        if self._pubsub:
+            await self._pubsub.close()
+        if self._redis:
+            await self._redis.close()
+
+    async def subscribe(self, topic: str):
+        await self._pubsub.subscribe(self.channel_prefix + topic)
+
+    async def unsubscribe(self, topic: str):
+        await self._pubsub.unsubscribe(self.channel_prefix + topic)
+
+    async def publish(self, topic: str, frame: str):
+        await self._redis.publish(self.channel_prefix + topic, frame)
+
+    async def _listen(self):
+        while True:
+            try:
+                # Nothing can be read until the first topic is subscribed
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                topic = message['channel'].decode()[len(self.channel_prefix):]
+                self._deliver(topic, message['data'].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error reading from chat pub/sub: {e}")
+                await asyncio.sleep(1.0)
+
+
+def create_pubsub_backend(channel_prefix: str = "chat-hub:"):
+    """Pick the pub/sub backend, set CHAT_PUBSUB_URL (redis://...) when running several workers"""
+    url = os.getenv("CHAT_PUBSUB_URL")
+    if url:
+        return RedisPubSub(url, channel_prefix)
+    return InProcessPubSub()
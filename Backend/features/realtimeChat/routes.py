@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from database import get_db
-from features.authentication.auth_jwt import get_current_user
-from features.authentication.models import User
+from pagination import decode_time_cursor, set_next_cursor
+from features.authentication.auth_jwt import CurrentUser, authenticate_token, get_current_user, get_admin_user
 from . import schemas
-from .chat_service import chat_service
+from .chat_service import ChatService, get_chat_service
+from .hub import chat_hub
 import json
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -13,23 +14,28 @@ router = APIRouter(prefix="/chat", tags=["chat"])
 @router.post("/rooms", response_model=schemas.ChatRoomRead)
 async def create_chat_room(
     chat_room: schemas.ChatRoomCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
+    chat_service: ChatService = Depends(get_chat_service),
     db: Session = Depends(get_db)
 ):
     # Ensure current user is in participants
     if current_user.id not in chat_room.participant_ids:
         chat_room.participant_ids.append(current_user.id)
     
-    return await chat_service.create_chat_room(
-        name=chat_room.name,
-        is_group=chat_room.is_group,
-        participant_ids=chat_room.participant_ids,
-        current_user=current_user
-    )
+    try:
+        return await chat_service.create_chat_room(
+            name=chat_room.name,
+            is_group=chat_room.is_group,
+            participant_ids=chat_room.participant_ids,
+            current_user=current_user
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/rooms", response_model=List[schemas.ChatRoomRead])
 async def get_user_chat_rooms(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
+    chat_service: ChatService = Depends(get_chat_service),
     db: Session = Depends(get_db)
 ):
     return await chat_service.get_user_chats(current_user)
@@ -37,10 +43,11 @@ async def get_user_chat_rooms(
 @router.get("/rooms/{chat_id}", response_model=schemas.ChatRoomRead)
 async def get_chat_room(
     chat_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
+    chat_service: ChatService = Depends(get_chat_service),
     db: Session = Depends(get_db)
 ):
-    chat = await chat_service.get_chat_room(chat_id, current_user)
+    chat = await chat_service.get_chat_room(chat_id, current_user, with_unread_count=True)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat room not found")
     return chat
@@ -49,7 +56,8 @@ async def get_chat_room(
 async def send_message(
     chat_id: str,
     message: schemas.MessageCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
+    chat_service: ChatService = Depends(get_chat_service),
     db: Session = Depends(get_db)
 ):
     chat = await chat_service.get_chat_room(chat_id, current_user)
@@ -60,56 +68,114 @@ async def send_message(
         chat_id=chat_id,
         current_user=current_user,
         content=message.content,
-        image_url=message.image_url
+        image_url=message.image_url,
+        participant_ids=chat['participant_ids']
     )
 
 @router.get("/rooms/{chat_id}/messages", response_model=List[schemas.MessageRead])
 async def get_chat_messages(
     chat_id: str,
-    limit: int = 50,
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    limit: int = Query(50, ge=1, le=100),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    chat_service: ChatService = Depends(get_chat_service),
     db: Session = Depends(get_db)
 ):
+    """Get a page of messages, newest first.
+
+    Pass the X-Next-Cursor header of a response as `before` to load older
+    messages, or as `after` when it came from an `after` page.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
     chat = await chat_service.get_chat_room(chat_id, current_user)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat room not found")
 
-    messages = await chat_service.get_chat_messages(chat_id, current_user, limit)
-    await chat_service.mark_messages_as_read(chat_id, current_user.id)
+    messages, next_cursor = await chat_service.get_chat_messages(
+        chat_id,
+        current_user,
+        limit,
+        before=decode_time_cursor(before) if before else None,
+        after=decode_time_cursor(after) if after else None
+    )
+    set_next_cursor(response, next_cursor)
+
+    # Scrolling back through history doesn't read anything new
+    if not before:
+        await chat_service.mark_messages_as_read(chat_id, current_user.id)
     return messages
 
+@router.get("/metrics")
+async def get_chat_metrics(current_user: CurrentUser = Depends(get_admin_user)):
+    """WebSocket fan-out queue depth and dropped frame counters (admin only)"""
+    return chat_hub.stats()
+
+async def _authenticate_websocket(websocket: WebSocket, token: Optional[str]) -> Optional[CurrentUser]:
+    """Resolve the `token` query parameter of a socket, closing it with 1008 when it isn't valid"""
+    if token:
+        db = next(get_db())
+        try:
+            return await authenticate_token(token, db)
+        except HTTPException:
+            pass
+        finally:
+            db.close()
+    await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+    return None
+
 @router.websocket("/ws/{chat_id}")
-async def websocket_endpoint(websocket: WebSocket, chat_id: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    chat_id: str,
+    token: Optional[str] = None,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    current_user = await _authenticate_websocket(websocket, token)
+    if current_user is None:
+        return
+    # Only participants may follow a room
+    if current_user.id not in await chat_service.store.get_participant_ids(chat_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
     await websocket.accept()
-    
-    def message_callback(message):
-        websocket.send_json(message)
-    
+
     # Subscribe to real-time updates for this chat
-    chat_service.subscribe_to_chat(chat_id, message_callback)
-    
+    connection = await chat_hub.connect(websocket, [f"chat:{chat_id}"])
+
     try:
         while True:
             # Keep the connection alive
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         # Clean up subscription when client disconnects
-        chat_service.unsubscribe_from_chat(chat_id, message_callback)
+        await chat_hub.disconnect(connection)
 
 @router.websocket("/ws/user/{user_id}")
-async def user_websocket_endpoint(websocket: WebSocket, user_id: str):
+async def user_websocket_endpoint(websocket: WebSocket, user_id: str, token: Optional[str] = None):
+    current_user = await _authenticate_websocket(websocket, token)
+    if current_user is None:
+        return
+    # A user's chat list updates are only for that user
+    if current_user.id != user_id:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
     await websocket.accept()
-    
-    def chat_update_callback(chat_update):
-        websocket.send_json(chat_update)
-    
+
     # Subscribe to real-time updates for all user's chats
-    chat_service.subscribe_to_user_chats(user_id, chat_update_callback)
-    
+    connection = await chat_hub.connect(websocket, [f"user:{user_id}"])
+
     try:
         while True:
             # Keep the connection alive
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         # Clean up subscription when client disconnects
-        chat_service.unsubscribe_from_user_chats(user_id, chat_update_callback) 
\ No newline at end of file
+        await chat_hub.disconnect(connection)
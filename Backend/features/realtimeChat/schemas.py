@@ -37,6 +37,7 @@ class ChatRoomRead(ChatRoomBase):
     last_message: Optional[str] = None
     last_message_time: Optional[datetime] = None
     participants: List[UserRead]
+    unread_count: int = 0
 
     class Config:
         from_attributes = True
@@ -0,0 +1,346 @@
+import asyncio
+import functools
+import secrets
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from database import get_db
+from . import crud
+
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+# (created_at, message_id) of the message a page continues from
+MessageKey = Tuple[str, str]
+
+
+def generate_push_id() -> str:
+    """Generate a Firebase-style push key locally so it can be used in a multi-path update"""
+    now = int(time.time() * 1000)
+    timestamp_chars = []
+    for _ in range(8):
+        timestamp_chars.append(PUSH_CHARS[now % 64])
+        now //= 64
+    random_chars = ''.join(secrets.choice(PUSH_CHARS) for _ in range(12))
+    return ''.join(reversed(timestamp_chars)) + random_chars
+
+
+def _message_key(item: Tuple[str, dict]) -> MessageKey:
+    msg_id, msg_data = item
+    return msg_data['created_at'], msg_id
+
+
+class ChatStore(ABC):
+    """Storage behind ChatService.
+
+    Chats and messages are plain dicts with ISO format timestamps. Read
+    markers are per chat and user, unread counters per user and chat.
+    """
+
+    @abstractmethod
+    async def create_chat(self, chat_data: dict, participant_ids: List[str]) -> str:
+        """Store a chat with its membership, returning the new chat id"""
+
+    @abstractmethod
+    async def get_chat(self, chat_id: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    async def get_chats(self, chat_ids: List[str]) -> Dict[str, dict]:
+        pass
+
+    @abstractmethod
+    async def get_participant_ids(self, chat_id: str) -> List[str]:
+        pass
+
+    @abstractmethod
+    async def get_user_chat_ids(self, user_id: str) -> List[str]:
+        pass
+
+    @abstractmethod
+    async def add_message(self, chat_id: str, message_data: dict, chat_update: dict, recipient_ids: List[str]) -> str:
+        """Store a message, update the chat summary, the sender's read marker and the
+        recipients' unread counters together, returning the new message id"""
+
+    @abstractmethod
+    async def list_messages(
+        self,
+        chat_id: str,
+        limit: int,
+        before: Optional[MessageKey] = None,
+        after: Optional[MessageKey] = None
+    ) -> List[Tuple[str, dict]]:
+        """Get up to `limit` messages strictly before/after a cursor (or the latest ones), oldest first"""
+
+    @abstractmethod
+    async def get_read_markers(self, chat_id: str) -> Dict[str, dict]:
+        pass
+
+    @abstractmethod
+    async def get_unread_count(self, user_id: str, chat_id: str) -> int:
+        pass
+
+    @abstractmethod
+    async def get_unread_counts(self, user_id: str) -> Dict[str, int]:
+        pass
+
+    @abstractmethod
+    async def mark_read(self, chat_id: str, user_id: str, read_at: str):
+        """Move a user's read marker and reset their unread counter"""
+
+
+class FirebaseChatStore(ChatStore):
+    """Chat storage on the Firebase Realtime Database.
+
+    The firebase_admin SDK is blocking, so every call runs on a bounded thread
+    pool instead of the event loop.
+
+    Layout:
+        chats/{chat_id}
+        messages/{chat_id}/{message_id}
+        user_chats/{user_id}/{chat_id} = True
+        chat_reads/{chat_id}/{user_id} = {'last_read_at': ...}
+        unread_counts/{user_id}/{chat_id} = int
+    """
+
+    def __init__(self, root_ref, max_workers: int = 16):
+        self.root_ref = root_ref
+        self.chats_ref = root_ref.child('chats')
+        self.messages_ref = root_ref.child('messages')
+        self.user_chats_ref = root_ref.child('user_chats')
+        self.chat_reads_ref = root_ref.child('chat_reads')
+        self.unread_counts_ref = root_ref.child('unread_counts')
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='firebase')
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def create_chat(self, chat_data: dict, participant_ids: List[str]) -> str:
+        chat_id = generate_push_id()
+        updates = {f'chats/{chat_id}': chat_data}
+        for user_id in set(participant_ids):
+            updates[f'user_chats/{user_id}/{chat_id}'] = True
+        # The chat and its membership index entries are written atomically
+        await self._run(self.root_ref.update, updates)
+        return chat_id
+
+    async def get_chat(self, chat_id: str) -> Optional[dict]:
+        return await self._run(self.chats_ref.child(chat_id).get)
+
+    async def get_chats(self, chat_ids: List[str]) -> Dict[str, dict]:
+        chats = await asyncio.gather(*(self.get_chat(chat_id) for chat_id in chat_ids))
+        return {chat_id: chat_data for chat_id, chat_data in zip(chat_ids, chats) if chat_data}
+
+    async def get_participant_ids(self, chat_id: str) -> List[str]:
+        return await self._run(self.chats_ref.child(chat_id).child('participant_ids').get) or []
+
+    async def get_user_chat_ids(self, user_id: str) -> List[str]:
+        chat_ids = await self._run(self.user_chats_ref.child(user_id).get, shallow=True)
+        return list((chat_ids or {}).keys())
+
+    async def add_message(self, chat_id: str, message_data: dict, chat_update: dict, recipient_ids: List[str]) -> str:
+        message_id = generate_push_id()
+        updates = {f'messages/{chat_id}/{message_id}': message_data}
+        for key, value in chat_update.items():
+            updates[f'chats/{chat_id}/{key}'] = value
+
+        # The sender has read their own message, everyone else gets an unread message
+        updates[f'chat_reads/{chat_id}/{message_data["sender_id"]}'] = {'last_read_at': message_data['created_at']}
+        updates[f'unread_counts/{message_data["sender_id"]}/{chat_id}'] = 0
+        for user_id in recipient_ids:
+            updates[f'unread_counts/{user_id}/{chat_id}'] = {'.sv': {'increment': 1}}
+
+        # Message, chat summary and counters are written in one atomic update
+        await self._run(self.root_ref.update, updates)
+        return message_id
+
+    async def list_messages(
+        self,
+        chat_id: str,
+        limit: int,
+        before: Optional[MessageKey] = None,
+        after: Optional[MessageKey] = None
+    ) -> List[Tuple[str, dict]]:
+        # Needs the created_at index from database.rules.json
+        query = self.messages_ref.child(chat_id).order_by_child('created_at')
+        # The inclusive bounds return the cursor message again, so fetch one more
+        if after:
+            query = query.start_at(after[0]).limit_to_first(limit + 1)
+        elif before:
+            query = query.end_at(before[0]).limit_to_last(limit + 1)
+        else:
+            query = query.limit_to_last(limit)
+
+        page = sorted((await self._run(query.get) or {}).items(), key=_message_key)
+        if after:
+            return [item for item in page if _message_key(item) > tuple(after)][:limit]
+        if before:
+            page = [item for item in page if _message_key(item) < tuple(before)]
+        return page[-limit:]
+
+    async def get_read_markers(self, chat_id: str) -> Dict[str, dict]:
+        return await self._run(self.chat_reads_ref.child(chat_id).get) or {}
+
+    async def get_unread_count(self, user_id: str, chat_id: str) -> int:
+        return await self._run(self.unread_counts_ref.child(user_id).child(chat_id).get) or 0
+
+    async def get_unread_counts(self, user_id: str) -> Dict[str, int]:
+        return await self._run(self.unread_counts_ref.child(user_id).get) or {}
+
+    async def mark_read(self, chat_id: str, user_id: str, read_at: str):
+        await self._run(self.root_ref.update, {
+            f'chat_reads/{chat_id}/{user_id}': {'last_read_at': read_at},
+            f'unread_counts/{user_id}/{chat_id}': 0
+        })
+
+
+class InMemoryChatStore(ChatStore):
+    """Process-local stand-in for FirebaseChatStore, for load tests and running without Firebase.
+
+    `latency` (seconds) is awaited on every call to mimic a network round trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.chats: Dict[str, dict] = {}
+        self.messages: Dict[str, Dict[str, dict]] = {}
+        self.user_chats: Dict[str, Dict[str, bool]] = {}
+        self.chat_reads: Dict[str, Dict[str, dict]] = {}
+        self.unread_counts: Dict[str, Dict[str, int]] = {}
+
+    async def _round_trip(self):
+        await asyncio.sleep(self.latency)
+
+    async def create_chat(self, chat_data: dict, participant_ids: List[str]) -> str:
+        await self._round_trip()
+        chat_id = generate_push_id()
+        self.chats[chat_id] = dict(chat_data)
+        for user_id in set(participant_ids):
+            self.user_chats.setdefault(user_id, {})[chat_id] = True
+        return chat_id
+
+    async def get_chat(self, chat_id: str) -> Optional[dict]:
+        await self._round_trip()
+        chat_data = self.chats.get(chat_id)
+        return dict(chat_data) if chat_data else None
+
+    async def get_chats(self, chat_ids: List[str]) -> Dict[str, dict]:
+        chats = await asyncio.gather(*(self.get_chat(chat_id) for chat_id in chat_ids))
+        return {chat_id: chat_data for chat_id, chat_data in zip(chat_ids, chats) if chat_data}
+
+    async def get_participant_ids(self, chat_id: str) -> List[str]:
+        await self._round_trip()
+        return list(self.chats.get(chat_id, {}).get('participant_ids', []))
+
+    async def get_user_chat_ids(self, user_id: str) -> List[str]:
+        await self._round_trip()
+        return list(self.user_chats.get(user_id, {}))
+
+    async def add_message(self, chat_id: str, message_data: dict, chat_update: dict, recipient_ids: List[str]) -> str:
+        await self._round_trip()
+        message_id = generate_push_id()
+        self.messages.setdefault(chat_id, {})[message_id] = dict(message_data)
+        if chat_id in self.chats:
+            self.chats[chat_id].update(chat_update)
+        self.chat_reads.setdefault(chat_id, {})[message_data['sender_id']] = {'last_read_at': message_data['created_at']}
+        self.unread_counts.setdefault(message_data['sender_id'], {})[chat_id] = 0
+        for user_id in recipient_ids:
+            counts = self.unread_counts.setdefault(user_id, {})
+            counts[chat_id] = counts.get(chat_id, 0) + 1
+        return message_id
+
+    async def list_messages(
+        self,
+        chat_id: str,
+        limit: int,
+        before: Optional[MessageKey] = None,
+        after: Optional[MessageKey] = None
+    ) -> List[Tuple[str, dict]]:
+        await self._round_trip()
+        page = sorted(
+            ((msg_id, dict(msg_data)) for msg_id, msg_data in self.messages.get(chat_id, {}).items()),
+            key=_message_key
+        )
+        if after:
+            return [item for item in page if _message_key(item) > tuple(after)][:limit]
+        if before:
+            page = [item for item in page if _message_key(item) < tuple(before)]
+        return page[-limit:]
+
+    async def get_read_markers(self, chat_id: str) -> Dict[str, dict]:
+        await self._round_trip()
+        return dict(self.chat_reads.get(chat_id, {}))
+
+    async def get_unread_count(self, user_id: str, chat_id: str) -> int:
+        await self._round_trip()
+        return self.unread_counts.get(user_id, {}).get(chat_id, 0)
+
+    async def get_unread_counts(self, user_id: str) -> Dict[str, int]:
+        await self._round_trip()
+        return dict(self.unread_counts.get(user_id, {}))
+
+    async def mark_read(self, chat_id: str, user_id: str, read_at: str):
+        await self._round_trip()
+        self.chat_reads.setdefault(chat_id, {})[user_id] = {'last_read_at': read_at}
+        self.unread_counts.setdefault(user_id, {})[chat_id] = 0
+
+
+class SQLChatStore(ChatStore):
+    """Chat storage in the application's PostgreSQL database (see models.py).
+
+    Each call runs in the threadpool with its own pooled session.
+    """
+
+    async def _run(self, func, *args, **kwargs):
+        def call():
+            db = next(get_db())
+            try:
+                return func(db, *args, **kwargs)
+            finally:
+                db.close()
+        return await run_in_threadpool(call)
+
+    async def create_chat(self, chat_data: dict, participant_ids: List[str]) -> str:
+        chat_id = generate_push_id()
+        await self._run(crud.create_chat, chat_id, chat_data, participant_ids)
+        return chat_id
+
+    async def get_chat(self, chat_id: str) -> Optional[dict]:
+        return (await self.get_chats([chat_id])).get(chat_id)
+
+    async def get_chats(self, chat_ids: List[str]) -> Dict[str, dict]:
+        return await self._run(crud.get_chats, chat_ids)
+
+    async def get_participant_ids(self, chat_id: str) -> List[str]:
+        return await self._run(crud.get_participant_ids, chat_id)
+
+    async def get_user_chat_ids(self, user_id: str) -> List[str]:
+        return await self._run(crud.get_user_chat_ids, user_id)
+
+    async def add_message(self, chat_id: str, message_data: dict, chat_update: dict, recipient_ids: List[str]) -> str:
+        message_id = generate_push_id()
+        await self._run(crud.add_message, message_id, chat_id, message_data, chat_update, recipient_ids)
+        return message_id
+
+    async def list_messages(
+        self,
+        chat_id: str,
+        limit: int,
+        before: Optional[MessageKey] = None,
+        after: Optional[MessageKey] = None
+    ) -> List[Tuple[str, dict]]:
+        return await self._run(crud.list_messages, chat_id, limit, before=before, after=after)
+
+    async def get_read_markers(self, chat_id: str) -> Dict[str, dict]:
+        return await self._run(crud.get_read_markers, chat_id)
+
+    async def get_unread_count(self, user_id: str, chat_id: str) -> int:
+        return (await self._run(crud.get_unread_counts, user_id, chat_id)).get(chat_id, 0)
+
+    async def get_unread_counts(self, user_id: str) -> Dict[str, int]:
+        return await self._run(crud.get_unread_counts, user_id)
+
+    async def mark_read(self, chat_id: str, user_id: str, read_at: str):
+        await self._run(crud.mark_read, chat_id, user_id, read_at)
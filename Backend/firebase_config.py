@@ -1,27 +1,43 @@
 import os
-from firebase_admin import credentials, initialize_app, db
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate({
-    "type": "service_account",
-    "project_id": os.getenv("FIREBASE_PROJECT_ID"),
-    "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
-    "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace('\\n', '\n'),
-    "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
-    "client_id": os.getenv("FIREBASE_CLIENT_ID"),
-    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-    "token_uri": "https://oauth2.googleapis.com/token",
-    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-    "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_CERT_URL")
-})
-
-# Initialize the app with Realtime Database URL
-initialize_app(cred, {
-    'databaseURL': os.getenv("FIREBASE_DATABASE_URL")
-})
-
-# Get a reference to the database
-db = db.reference()
\ No newline at end of file
+_db_reference = None
+_init_lock = threading.Lock()
+
+
+def get_db_reference():
+    """Get a reference to the root of the Realtime Database.
+
+    The Firebase Admin SDK is imported and initialized on first use, so
+    processes that never touch Firebase don't need its credentials.
+    """
+    global _db_reference
+    if _db_reference is None:
+        with _init_lock:
+            if _db_reference is None:
+                from firebase_admin import credentials, initialize_app, db
+
+                # Initialize Firebase Admin SDK
+                cred = credentials.Certificate({
+                    "type": "service_account",
+                    "project_id": os.getenv("FIREBASE_PROJECT_ID"),
+                    "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
+                    "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace('\\n', '\n'),
+                    "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
+                    "client_id": os.getenv("FIREBASE_CLIENT_ID"),
+                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                    "token_uri": "https://oauth2.googleapis.com/token",
+                    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+                    "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_CERT_URL")
+                })
+
+                # Initialize the app with Realtime Database URL
+                initialize_app(cred, {
+                    'databaseURL': os.getenv("FIREBASE_DATABASE_URL")
+                })
+
+                _db_reference = db.reference()
+    return _db_reference
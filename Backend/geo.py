@@ -0,0 +1,79 @@
+import math
+from typing import List, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+GEOHASH_PRECISION = 9
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a point as a geohash; points that share a prefix lie in the same cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        interval, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def _cell_size_degrees(precision: int) -> Tuple[float, float]:
+    """(lat, lon) size in degrees of a geohash cell of the given precision"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_prefixes(lat: float, lon: float, radius_km: float) -> List[str]:
+    """Geohash prefixes whose cells together cover every point within `radius_km` of (lat, lon).
+
+    Picks the finest precision whose cells are at least `radius_km` on each
+    side, so the cell containing the point plus its 8 neighbours cover the
+    circle. Returns an empty list if the radius is too large to bucket, in
+    which case every row is a candidate.
+    """
+    lon_scale = max(math.cos(math.radians(lat)), 1e-6)
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        lat_deg, lon_deg = _cell_size_degrees(candidate)
+        if lat_deg * KM_PER_DEGREE < radius_km or lon_deg * KM_PER_DEGREE * lon_scale < radius_km:
+            break
+        precision = candidate
+    if precision == 0:
+        return []
+
+    lat_deg, lon_deg = _cell_size_degrees(precision)
+    prefixes = set()
+    for d_lat in (-1, 0, 1):
+        for d_lon in (-1, 0, 1):
+            cell_lat = min(max(lat + d_lat * lat_deg, -90.0), 90.0)
+            cell_lon = (lon + d_lon * lon_deg + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash_encode(cell_lat, cell_lon, precision))
+    return sorted(prefixes)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Column, String, Integer, Text, DateTime, Index, UniqueConstraint, delete
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from database import Base
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+# How long a request may hold its key before it is considered abandoned (e.g. the worker
+# crashed) and a retry may claim the key again. Must exceed the slowest request.
+IDEMPOTENCY_LEASE = timedelta(seconds=int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60")))
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'endpoint', 'key', name='uq_idempotency_keys_user_endpoint_key'),
+        Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    endpoint = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    # Hash of the request body, a key can't be reused for a different request
+    request_hash = Column(String, nullable=False)
+    # Both stay NULL while the first request is still being processed, until then
+    # expires_at is the end of its lease rather than of the retention period
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+def _request_hash(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+def _reserve(db: Session, user_id: str, endpoint: str, key: str, request_hash: str) -> Optional[IdempotencyRecord]:
+    """Claim a key for this request, or return the record of the request that already claimed it"""
+    now = datetime.now(timezone.utc)
+    for _ in range(2):
+        record = IdempotencyRecord(
+            user_id=user_id,
+            endpoint=endpoint,
+            key=key,
+            request_hash=request_hash,
+            expires_at=now + IDEMPOTENCY_LEASE
+        )
+        db.add(record)
+        try:
+            db.commit()
+            return None
+        except IntegrityError:
+            db.rollback()
+
+        # An expired key or an abandoned lease is released on demand, purge_expired_keys cleans up the rest
+        expired = db.execute(delete(IdempotencyRecord).where(
+            IdempotencyRecord.user_id == user_id,
+            IdempotencyRecord.endpoint == endpoint,
+            IdempotencyRecord.key == key,
+            IdempotencyRecord.expires_at <= now
+        )).rowcount
+        db.commit()
+        if expired:
+            continue
+
+        existing = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.user_id == user_id,
+            IdempotencyRecord.endpoint == endpoint,
+            IdempotencyRecord.key == key
+        ).first()
+        if existing is not None:
+            return existing
+        # Otherwise the other request failed and released the key in the meantime
+    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is already in progress")
+
+
+def _release(db: Session, user_id: str, endpoint: str, key: str):
+    db.rollback()
+    db.execute(delete(IdempotencyRecord).where(
+        IdempotencyRecord.user_id == user_id,
+        IdempotencyRecord.endpoint == endpoint,
+        IdempotencyRecord.key == key
+    ))
+    db.commit()
+
+
+def run_idempotent(
+    db: Session,
+    key: Optional[str],
+    user_id: str,
+    endpoint: str,
+    payload: BaseModel,
+    response_model: Any,
+    execute: Callable[[], Any]
+):
+    """Run `execute` once per (user, endpoint, Idempotency-Key) and replay its response for retries.
+
+    Without a key the request just runs. A failed request releases its key,
+    so the client can retry it; only successful responses are stored.
+    """
+    if not key:
+        return execute()
+
+    request_hash = _request_hash(payload)
+    existing = _reserve(db, user_id, endpoint, key, request_hash)
+    if existing is not None:
+        if existing.request_hash != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if existing.response_status is None:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is already in progress")
+        return JSONResponse(
+            content=json.loads(existing.response_body),
+            status_code=existing.response_status,
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    try:
+        result = execute()
+    except Exception:
+        _release(db, user_id, endpoint, key)
+        raise
+
+    adapter = TypeAdapter(response_model)
+    body = adapter.dump_python(adapter.validate_python(result), mode='json')
+    try:
+        db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.user_id == user_id,
+            IdempotencyRecord.endpoint == endpoint,
+            IdempotencyRecord.key == key
+        ).update({
+            IdempotencyRecord.response_status: 200,
+            IdempotencyRecord.response_body: json.dumps(body),
+            IdempotencyRecord.expires_at: datetime.now(timezone.utc) + IDEMPOTENCY_TTL
+        }, synchronize_session=False)
+        db.commit()
+    except SQLAlchemyError:
+        # The request itself succeeded, so answer it; only its replay is lost.
+        # If the key can't be released either, its lease runs out on its own.
+        try:
+            _release(db, user_id, endpoint, key)
+        except SQLAlchemyError:
+            db.rollback()
+    return body
+
+
+def purge_expired_keys(db: Session, batch_size: int = 1000) -> int:
+    """Delete expired idempotency records in batches, returns the number deleted"""
+    deleted = 0
+    while True:
+        expired_ids = (
+            db.query(IdempotencyRecord.id)
+            .filter(IdempotencyRecord.expires_at <= datetime.now(timezone.utc))
+            .limit(batch_size)
+            .subquery()
+        )
+        result = db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.id.in_(expired_ids.select())))
+        db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
@@ -1,4 +1,11 @@
+import time
+
+_import_started = time.perf_counter()
+
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 import database
 from fastapi.middleware.cors import CORSMiddleware
 from features.authentication.routes import router as auth_router
@@ -9,15 +16,48 @@ from features.products.order_routes import router as order_router
 from features.realtimeChat.routes import router as chat_router
 from features.moderator.routes import router as moderator_router
 from features.products.meetup_routes import router as meetup_router
+from features.realtimeChat.chat_service import get_chat_service
+from features.realtimeChat.hub import chat_hub
+from features.authentication.hashing import password_hasher
+from features.authentication.invalidation import cache_invalidator
+from pagination import NEXT_CURSOR_HEADER
+
+_import_seconds = time.perf_counter() - _import_started
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timings = {"imports": _import_seconds}
+
+    started = time.perf_counter()
+    try:
+        await run_in_threadpool(database.Base.metadata.create_all, bind=database.engine)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise e
+    timings["create_all"] = time.perf_counter() - started
+
+    # Role changes and deletes on other workers clear this worker's caches
+    await cache_invalidator.start()
+
+    # Chat (and Firebase) is otherwise set up by the first chat request
+    if os.getenv("CHAT_EAGER_INIT") == "1":
+        started = time.perf_counter()
+        await run_in_threadpool(get_chat_service)
+        timings["chat_service"] = time.perf_counter() - started
+
+    report = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items())
+    print(f"Startup finished in {sum(timings.values()) * 1000:.0f}ms ({report})")
+
+    yield
+
+    await cache_invalidator.stop()
+    await chat_hub.stop()
+    password_hasher.shutdown()
 
-try:
-    database.Base.metadata.create_all(bind=database.engine)
-except Exception as e:
-    import traceback
-    traceback.print_exc()
-    raise e
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -30,6 +70,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 app.include_router(auth_router)
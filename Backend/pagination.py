@@ -0,0 +1,71 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    """Build an opaque cursor token from the sort key of the last item of a page"""
+    raw = json.dumps(list(values), default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, size: int = 2) -> list:
+    """Decode a cursor created by encode_cursor, raising a 400 if it was tampered with"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def decode_time_cursor(token: str) -> list:
+    """Decode a (created_at, id) cursor, raising a 400 unless both are strings and created_at is an ISO timestamp"""
+    created_at, item_id = decode_cursor(token)
+    if not isinstance(created_at, str) or not isinstance(item_id, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        datetime.fromisoformat(created_at)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return [created_at, item_id]
+
+
+def set_next_cursor(response: Response, cursor: Optional[str]):
+    """Expose the cursor of the next page to the client, if there is one"""
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def paginate(query: Query, model, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """Get a page of `query`, newest first by (created_at, id), and the cursor of the next page.
+
+    With a cursor the page is a keyset seek on the (created_at, id) index, so
+    deep pages cost the same as the first one. `skip` keeps offset paging
+    working for existing clients.
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, item_id = decode_time_cursor(cursor)
+        created_at = datetime.fromisoformat(created_at)
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, item_id))
+    elif skip:
+        query = query.offset(skip)
+
+    # One extra row tells us whether there is another page
+    items = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
+    return items, next_cursor
@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import database
+
+
+class QueryCounter:
+    """Statements executed on an engine while a count_queries block is active"""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine: Optional[Engine] = None):
+    """Record every SQL statement executed on `engine` (the app engine by default) inside the block"""
+    engine = engine or database.engine
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter._before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, engine: Optional[Engine] = None):
+    """Fail if the block runs more than `max_queries` statements, e.g. because a relationship lazy loads per row"""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > max_queries:
+        statements = "\n".join(counter.statements)
+        raise AssertionError(f"Expected at most {max_queries} queries, got {counter.count}:\n{statements}")
@@ -0,0 +1,35 @@
+from typing import Dict, List
+
+from sqlalchemy import exists, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+# Delete guards: each check is an EXISTS over a foreign key column, so the
+# database stops at the first matching index entry instead of the related
+# rows being loaded into the session.
+
+
+def find_references(db: Session, checks: Dict[str, object]) -> List[str]:
+    """Names of the `checks` (name -> WHERE clause) matching at least one row, in a single query"""
+    row = db.execute(select(*(exists().where(clause).label(name) for name, clause in checks.items()))).one()
+    return [name for name in checks if row._mapping[name]]
+
+
+def delete_unreferenced(db: Session, what: str, checks: Dict[str, object], *statements) -> int:
+    """Run the DELETE `statements` in one transaction unless one of `checks` still references the row.
+
+    Raises ValueError naming the references otherwise, returns the number of
+    rows deleted by the last statement (0 if the row was already gone).
+    """
+    references = find_references(db, checks)
+    if references:
+        raise ValueError(f"Cannot delete {what} with associated {' or '.join(references)}")
+    try:
+        for statement in statements:
+            deleted = db.execute(statement).rowcount
+        db.commit()
+    except IntegrityError:
+        # A reference was added between the check and the delete
+        db.rollback()
+        raise ValueError(f"Cannot delete {what} that is still referenced")
+    return deleted
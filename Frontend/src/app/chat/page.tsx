@@ -20,7 +20,7 @@ export default function ChatPage() {
     if (user) {
       fetchChatRooms();
       
-      const userWs = new WebSocket(`ws://${process.env.NEXT_PUBLIC_SERVER_URL}/chat/ws/user/${user.id}`);
+      const userWs = new WebSocket(`ws://${process.env.NEXT_PUBLIC_SERVER_URL}/chat/ws/user/${user.id}?token=${encodeURIComponent(localStorage.getItem('access_token') ?? '')}`);
       userWs.onmessage = (event) => {
         const update = JSON.parse(event.data);
         setChatRooms(prev => {
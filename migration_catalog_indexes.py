@@ -0,0 +1,77 @@
+"""Add the product search vector and the keyset pagination, catalog filter and delete check indexes
+
+Copy into Backend/alembic/versions next to migration_university_geohash.py
+and run `alembic upgrade head`. The indexes are built with CREATE INDEX
+CONCURRENTLY, so the tables stay writable while they are built. Adding the
+stored search_vector column rewrites the products table under a lock.
+
+Revision ID: 9d4e7b2c5a18
+Revises: 6c2f1a9e4b7d
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e7b2c5a18'
+down_revision: Union[str, None] = '6c2f1a9e4b7d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same expression as Product.search_vector, title matches rank above category/description
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+# name -> (table, column list and options), matching the __table_args__ of the models
+INDEXES = {
+    # Product listings, catalog filters and seller pages
+    'ix_products_created_at_id': ('products', '(created_at, id)'),
+    'ix_products_visibility_created_at_id': ('products', '(visibility, created_at, id)'),
+    'ix_products_university_id_created_at_id': ('products', '(university_id, created_at, id)'),
+    'ix_products_university_id_status_created_at_id': ('products', '(university_id, status, created_at, id)'),
+    'ix_products_category_created_at_id': ('products', '(category, created_at, id)'),
+    'ix_products_condition_created_at_id': ('products', '(condition, created_at, id)'),
+    'ix_products_price': ('products', '(price)'),
+    'ix_products_in_stock_created_at_id': ('products', '(created_at, id) WHERE stock > 0'),
+    'ix_products_seller_id_visibility_created_at_id': ('products', '(seller_id, visibility, created_at, id)'),
+    'ix_products_search_vector': ('products', 'USING gin (search_vector)'),
+    # Order and meetup listings, and the product delete check
+    'ix_orders_created_at_id': ('orders', '(created_at, id)'),
+    'ix_orders_product_id': ('orders', '(product_id)'),
+    'ix_orders_buyer_id_created_at_id': ('orders', '(buyer_id, created_at, id)'),
+    'ix_orders_seller_id_created_at_id': ('orders', '(seller_id, created_at, id)'),
+    'ix_meetups_created_at_id': ('meetups', '(created_at, id)'),
+    'ix_meetups_buyer_id_created_at_id': ('meetups', '(buyer_id, created_at, id)'),
+    'ix_meetups_seller_id_created_at_id': ('meetups', '(seller_id, created_at, id)'),
+    'ix_meetups_product_id_created_at_id': ('meetups', '(product_id, created_at, id)'),
+    # Admin user listing and the university/user delete checks
+    'ix_users_created_at_id': ('users', '(created_at, id)'),
+    'ix_users_role_created_at_id': ('users', '(role, created_at, id)'),
+    'ix_users_university_id_created_at_id': ('users', '(university_id, created_at, id)'),
+    'ix_users_username_pattern': ('users', '(username text_pattern_ops)'),
+    'ix_moderator_requests_created_at_id': ('moderator_requests', '(created_at, id)'),
+    'ix_moderator_requests_user_id': ('moderator_requests', '(user_id)'),
+}
+
+
+def upgrade() -> None:
+    op.execute(
+        'ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector '
+        f'GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED'
+    )
+    # CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, (table, definition) in INDEXES.items():
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in reversed(list(INDEXES)):
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    op.execute('ALTER TABLE products DROP COLUMN IF EXISTS search_vector')
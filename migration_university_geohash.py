@@ -0,0 +1,48 @@
+"""Add the university geohash used by the nearby lookups
+
+Copy into Backend/alembic/versions and set down_revision to the current
+head (`alembic heads`) before running `alembic upgrade head`.
+
+Revision ID: 6c2f1a9e4b7d
+Revises:
+Create Date: 2026-10-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from geo import GEOHASH_PRECISION, geohash_encode
+
+# revision identifiers, used by Alembic.
+revision: str = '6c2f1a9e4b7d'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 500
+
+
+def upgrade() -> None:
+    # Byte-wise collation so geohash prefix ranges match the B-tree order
+    op.execute(f'ALTER TABLE universities ADD COLUMN IF NOT EXISTS geohash varchar({GEOHASH_PRECISION}) COLLATE "C"')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_universities_geohash ON universities (geohash)')
+
+    # Backfill existing universities, same as `python -m features.products.maintenance backfill-geohash`
+    connection = op.get_bind()
+    while True:
+        rows = connection.execute(sa.text(
+            'SELECT id, latitude, longitude FROM universities WHERE geohash IS NULL LIMIT :limit'
+        ), {'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        connection.execute(
+            sa.text('UPDATE universities SET geohash = :geohash WHERE id = :id'),
+            [{'id': row.id, 'geohash': geohash_encode(row.latitude, row.longitude)} for row in rows]
+        )
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_universities_geohash')
+    op.execute('ALTER TABLE universities DROP COLUMN IF EXISTS geohash')